@@ -2,11 +2,20 @@
 import streamlit as st
 import os
 import tempfile
-from src.ingestion import ingest_file
-from src.retrieval import get_advanced_retriever_chain
+import time
+from src.jobs import get_job_queue, QUEUED, RUNNING, DONE, FAILED
+from src.retrieval import get_retrieval_engine
 from src.llm import generate_response
 from src.memory import UserMemory
+from src.memory_writer import get_memory_writer
+from src.memory_context import get_memory_context_builder
+from src.memory_consolidation import start_consolidation_scheduler
 from src.vector_db import list_documents, delete_document
+from src.query_pipeline import get_query_pipeline
+from src.answer_cache import get_answer_cache
+from src.config import ANSWER_CACHE_ENABLED, MEMORY_WRITE_ASYNC, MEM0_STORAGE_PATH
+from src.model_registry import get_model_stats
+from src.query_encoder import get_query_encoder
 
 # Page Config
 st.set_page_config(page_title="Antigravity Vibe RAG", page_icon="🌌", layout="wide")
@@ -300,19 +309,16 @@ st.markdown("""
 st.markdown('<h1 class="main-title">🌌 Antigravity Vibe RAG</h1>', unsafe_allow_html=True)
 st.markdown('<p class="subtitle">Intelligent Document Assistant powered by Advanced RAG</p>', unsafe_allow_html=True)
 
-# Global State Init
-if "is_ingesting" not in st.session_state:
-    st.session_state.is_ingesting = False
-if "data_version" not in st.session_state:
-    st.session_state.data_version = 0
+# Background ingestion worker (shared by all sessions)
+job_queue = get_job_queue()
 
 @st.cache_resource
-def get_retriever(user_id=None, version=0):
+def get_retriever():
     """
-    Retriever cache depends on data version. 
-    When data changes, version increments -> new retriever created.
+    One retrieval engine shared by all users and sessions.
+    The user filter is applied per query; data changes only clear its result cache.
     """
-    return get_advanced_retriever_chain(user_id=user_id)
+    return get_retrieval_engine()
 
 @st.cache_resource
 def get_shared_memory_client():
@@ -320,13 +326,18 @@ def get_shared_memory_client():
     # We initialize with a system ID, but we only care about the .memory object
     try:
         # Check if lock file exists to fast fail or clean up
-        lock_file = "./mem0_storage_v4/.lock"
+        lock_file = os.path.join(MEM0_STORAGE_PATH, ".lock")
         if os.path.exists(lock_file):
             # In a real prod environment we might wait, but for local app
             # we can try to warn or sometimes the lock is stale.
             pass
 
         init_mem = UserMemory(user_id="SYSTEM_INIT")
+        if MEMORY_WRITE_ASYNC:
+            # Start the background writer now so journaled turns from a previous run are replayed
+            get_memory_writer(init_mem.memory)
+        # The embedded store is locked by this process, so periodic consolidation runs here
+        start_consolidation_scheduler(init_mem.memory)
         return init_mem.memory
     except RuntimeError as e:
         if "already accessed" in str(e):
@@ -372,6 +383,9 @@ with st.sidebar:
                     st.markdown(f"- {mem}")
         else:
             st.markdown("*No memories yet.*")
+        pending_writes = st.session_state.user_memory.pending_writes()
+        if pending_writes:
+            st.caption(f"⏳ {pending_writes} recent interactions are still being saved")
     
     st.markdown("---")
 
@@ -381,15 +395,10 @@ with st.sidebar:
         st.markdown('<p class="sidebar-header">🛠️ Admin Control</p>', unsafe_allow_html=True)
         st.info("🔓 Admin Mode Active: You can ingest documents.")
         
-        # Initialize ingestion state
-        if "is_ingesting" not in st.session_state:
-            st.session_state.is_ingesting = False
-        
         uploaded_file = st.file_uploader(
             "Upload System Documents (Policies/Terms)", 
             type=["pdf", "docx"], 
-            label_visibility="collapsed",
-            disabled=st.session_state.is_ingesting
+            label_visibility="collapsed"
         )
         
         if uploaded_file:
@@ -398,51 +407,46 @@ with st.sidebar:
             # Option to ingest as Global Knowledge
             is_global = st.checkbox("🌐 Ingest as Global Policy (All users can see)", value=True)
             
-            if st.session_state.is_ingesting:
-                st.warning("⏳ Ingestion in progress... Please wait.")
-            else:
-                if st.button("🚀 Ingest File", use_container_width=True):
-                    st.session_state.is_ingesting = True
-                    st.session_state.ingest_global = is_global # Store state
-                    st.rerun()
-        
-        # Run ingestion if flag is set
-        if st.session_state.is_ingesting and uploaded_file:
-            # Determine effective user_id
-            effective_user_id = st.session_state.current_user_id
-            if st.session_state.get("ingest_global", False):
-                effective_user_id = "GLOBAL"
-                display_msg = "Global Knowledge Base"
-            else:
-                display_msg = f"User: {effective_user_id}"
-
-            with st.status(f"✨ Extracting for {display_msg}...", expanded=True) as status:
-                st.write("🔒 Chat is disabled during ingestion")
+            if st.button("🚀 Ingest File", use_container_width=True):
+                # Determine effective user_id
+                effective_user_id = "GLOBAL" if is_global else st.session_state.current_user_id
+                display_msg = "Global Knowledge Base" if is_global else f"User: {effective_user_id}"
                 
+                # The worker owns the temp file: removed once the job succeeds or is dismissed
                 with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp:
                     tmp.write(uploaded_file.getvalue())
                     tmp_path = tmp.name
                 
-                try:
-                    st.write(f"📄 Converting document...")
-                    # Pass effective_user_id to ingestion
-                    result = ingest_file(tmp_path, user_id=effective_user_id, original_filename=uploaded_file.name)
-                    
-                    status.update(label="✅ Ingestion Complete!", state="complete", expanded=False)
-                    st.session_state.is_ingesting = False
-                    st.session_state.ingest_global = False # Reset
-                    
-                    # Force retriever update by incrementing version
-                    st.session_state.data_version += 1
-                    
-                    st.success(f"✅ Document added to {display_msg}!")
-                    st.rerun()
-                    
-                except Exception as e:
-                    status.update(label="❌ Ingestion Failed", state="error", expanded=True)
-                    st.session_state.is_ingesting = False
-                    st.session_state.ingest_global = False # Reset
-                    st.error(f"❌ Error: {e}")
+                job_queue.submit(tmp_path, user_id=effective_user_id, filename=uploaded_file.name)
+                st.success(f"📥 Queued for {display_msg}. Chat stays available while it ingests.")
+        
+        # Job table, polled without rerunning the whole app
+        @st.fragment(run_every=2)
+        def render_ingestion_jobs():
+            jobs = job_queue.list_jobs(limit=10)
+            if not jobs:
+                return
+            st.markdown("**⏳ Ingestion Jobs**")
+            status_icons = {QUEUED: "🕒", RUNNING: "⚙️", DONE: "✅", FAILED: "❌"}
+            for job in jobs:
+                label = f"{status_icons[job['status']]} `{job['filename']}` • {job['status']}"
+                if job["status"] == RUNNING:
+                    eta = f" • ETA {job['eta_s']:.0f}s" if job["eta_s"] is not None else ""
+                    st.progress(job["progress"], text=f"{label}{eta}")
+                elif job["status"] == DONE:
+                    st.markdown(f"{label} • {job['chunks']} chunks")
+                elif job["status"] == FAILED:
+                    st.markdown(f"{label}: {job['error']}")
+                    retry_col, dismiss_col = st.columns(2)
+                    if retry_col.button("🔁 Retry", key=f"retry_{job['id']}", use_container_width=True):
+                        if not job_queue.retry(job["id"]):
+                            st.warning("Upload is no longer available, please upload the file again.")
+                    if dismiss_col.button("🗑️ Dismiss", key=f"dismiss_{job['id']}", use_container_width=True):
+                        job_queue.dismiss(job["id"])
+                else:
+                    st.markdown(label)
+        
+        render_ingestion_jobs()
         
         st.markdown("---")
         st.markdown('<p class="sidebar-header">🗂️ Document Management</p>', unsafe_allow_html=True)
@@ -453,7 +457,10 @@ with st.sidebar:
                 # Just rerunning to fetch fresh list
                 st.rerun()
                 
-            docs_info = list_documents()
+            # Catalog pages: stack of scroll offsets of the pages visited so far
+            if "doc_page_offsets" not in st.session_state:
+                st.session_state.doc_page_offsets = [None]
+            docs_info, next_offset = list_documents(offset=st.session_state.doc_page_offsets[-1])
             
             if not docs_info:
                 st.info("No documents found in database.")
@@ -462,17 +469,31 @@ with st.sidebar:
                     col1, col2 = st.columns([3, 1])
                     with col1:
                         user_label = "🌐 GLOBAL" if info['user_id'] == "GLOBAL" else f"👤 {info['user_id']}"
-                        st.markdown(f"**{source}**\n\n`{user_label}` • `{info['count']} chunks`")
+                        details = f"`{user_label}` • `{info['count']} chunks`"
+                        if info.get("size_bytes"):
+                            details += f" • `{info['size_bytes'] / (1024 * 1024):.1f} MB`"
+                        if info.get("ingested_at"):
+                            details += f" • `{time.strftime('%Y-%m-%d %H:%M', time.localtime(info['ingested_at']))}`"
+                        st.markdown(f"**{source}**\n\n{details}")
                     with col2:
                         if st.button("🗑️", key=f"del_{source}", help=f"Delete {source}"):
                             if delete_document(source):
                                 st.success(f"Deleted {source}")
-                                st.session_state.data_version += 1 # Force cache update
                                 st.rerun()
                             else:
                                 st.error("Failed to delete")
                     st.markdown("---")
 
+            page_col1, page_col2 = st.columns(2)
+            with page_col1:
+                if len(st.session_state.doc_page_offsets) > 1 and st.button("⬅️ Prev", key="docs_prev"):
+                    st.session_state.doc_page_offsets.pop()
+                    st.rerun()
+            with page_col2:
+                if next_offset is not None and st.button("Next ➡️", key="docs_next"):
+                    st.session_state.doc_page_offsets.append(next_offset)
+                    st.rerun()
+
     else:
         # Regular User View
         st.markdown('<p class="sidebar-header">ℹ️ Information</p>', unsafe_allow_html=True)
@@ -502,11 +523,44 @@ with st.sidebar:
         st.markdown("🟢 **Vector DB**")
     with col2:
         st.markdown("🟢 **Memory**")
-        if st.session_state.is_ingesting:
+        if job_queue.active_count():
             st.markdown("🟡 **Ingesting...**")
         else:
             st.markdown("🟢 **Ready**")
 
+    # Shared model registry: load time and resident memory
+    model_stats = get_model_stats()
+    if model_stats["models"]:
+        with st.expander("🧮 Loaded Models", expanded=False):
+            for name, stats in model_stats["models"].items():
+                st.markdown(f"- `{name}` • {stats['load_time_s']}s")
+            st.caption(f"Process RSS: {model_stats['rss_mb']:,.0f} MB")
+
+    # Query embedding cache / micro-batching
+    encoder_stats = get_query_encoder().stats()
+    if encoder_stats["hits"] + encoder_stats["misses"]:
+        with st.expander("⚡ Query Performance", expanded=False):
+            st.markdown(f"- Cache hit rate: `{encoder_stats['hit_rate']:.0%}` "
+                        f"({encoder_stats['hits']} hits / {encoder_stats['misses']} misses)")
+            st.markdown(f"- Batches: `{encoder_stats['batches']}` • avg size `{encoder_stats['avg_batch_size']}` "
+                        f"• avg `{encoder_stats['avg_encode_ms']} ms`")
+            histogram = " • ".join(f"{size}: {count}" for size, count in encoder_stats["batch_size_histogram"].items())
+            st.caption(f"Batch sizes: {histogram}")
+            answer_stats = get_answer_cache().stats()
+            st.markdown(f"- Answer cache hit rate: `{answer_stats['hit_rate']:.0%}` "
+                        f"({answer_stats['entries']} answers cached)")
+            for action, stats in get_retriever().policy_stats().items():
+                st.markdown(f"- Rerank `{action}`: {stats['queries']} queries • "
+                            f"p50 `{stats['p50_ms']} ms` • p95 `{stats['p95_ms']} ms`")
+            if MEMORY_WRITE_ASYNC:
+                writer_stats = get_memory_writer(get_shared_memory_client()).stats()
+                st.markdown(f"- Memory writes: `{writer_stats['written']}` interactions in "
+                            f"`{writer_stats['batches']}` extraction calls (avg `{writer_stats['avg_batch']}`) • "
+                            f"`{writer_stats['pending']}` pending • `{writer_stats['failures']}` failures")
+            context_stats = get_memory_context_builder().stats()
+            st.markdown(f"- Memory context cache hit rate: `{context_stats['hit_rate']:.0%}` "
+                        f"({context_stats['users_cached']} users cached, {context_stats['invalidations']} invalidations)")
+
 # Memory Init - Fallback if not initialized
 if "user_memory" not in st.session_state:
     # This might happen on first run before sidebar executes? 
@@ -551,27 +605,38 @@ if prompt := st.chat_input("💬 Ask me anything about your documents..."):
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         
-        # Retrieval - Pass current User ID and Data Version
+        # Retrieval (filtered for the current User ID) and Memory, fetched concurrently
         current_user = st.session_state.current_user_id
-        retriever = get_retriever(user_id=current_user, version=st.session_state.data_version)
-        relevant_docs = retriever.invoke(prompt)
+        turn = get_query_pipeline().prepare(prompt, current_user, st.session_state.user_memory)
+        relevant_docs = turn["docs"]
+        context_text = turn["context"]
+        mem_context = turn["memory_context"]
+        data_version = turn["data_version"]
+        if turn["degraded"]:
+            st.caption(f"⚠️ Answering without: {', '.join(turn['degraded'])} (timed out or failed)")
         
-        context_text = "\n\n".join([d.page_content for d in relevant_docs])
+        # Semantic answer cache: only for answers that do not depend on user memory
+        use_answer_cache = ANSWER_CACHE_ENABLED and not mem_context
+        full_response = None
+        if use_answer_cache:
+            query_vector = get_query_encoder().embed_query(prompt)
+            full_response = get_answer_cache().lookup(query_vector, relevant_docs, current_user)
         
-        # Memory
-        mem_context = st.session_state.user_memory.get_context(prompt)
-        
-        # Generator
-        full_response = ""
-        stream = generate_response(context_text, mem_context, prompt)
-        
-        for chunk in stream:
-            full_response += chunk
-            message_placeholder.markdown(full_response + "▌")
+        if full_response is None:
+            # Generator
+            full_response = ""
+            stream = generate_response(context_text, mem_context, prompt)
+            
+            for chunk in stream:
+                full_response += chunk
+                message_placeholder.markdown(full_response + "▌")
+            
+            if use_answer_cache:
+                get_answer_cache().store(query_vector, relevant_docs, current_user, full_response, data_version)
         
         message_placeholder.markdown(full_response)
         
-        # Save to Memory
+        # Save to Memory (journaled and written in the background, batched per user)
         st.session_state.user_memory.add_interaction(prompt, full_response)
         st.session_state.messages.append({"role": "assistant", "content": full_response})
 
@@ -0,0 +1,90 @@
+"""
+ColBERT (MaxSim in Qdrant) vs cross-encoder reranking: quality and latency per turn.
+
+Needs a collection with ColBERT vectors: set RERANK_MODE = "colbert" in src/config.py,
+then ingest or run `python -m src.vector_db migrate`. Queries file as in bench_reranker:
+
+    {"query": "...", "relevant_ids": ["<point id>", ...]}   relevant_ids optional
+
+With labels, both methods get nDCG@k against them; without, the cross-encoder
+ranking is the reference and ColBERT is scored by nDCG@k / overlap@k against it.
+
+    python -m benchmarks.bench_colbert_rerank queries.jsonl
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_reranker import load_queries, ndcg_at_k
+from src.config import TOP_K_RERANK
+from src.retrieval import build_user_filter, colbert_rerank_search, get_retrieval_engine
+from src.vector_db import get_collection_layout
+
+def _ids(docs):
+    return [str(doc.metadata.get("_id", doc.id)) for doc in docs]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare ColBERT MaxSim and cross-encoder reranking.")
+    parser.add_argument("queries", help="JSONL file with {\"query\", \"relevant_ids\"?} per line")
+    parser.add_argument("--user-id", default="GLOBAL", help="Tenant whose documents are searched")
+    parser.add_argument("--k", type=int, default=TOP_K_RERANK)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per query (after one warm-up)")
+    args = parser.parse_args(argv)
+
+    engine = get_retrieval_engine()
+    if get_collection_layout(engine.client)["colbert"] is None:
+        raise SystemExit("Collection has no ColBERT vectors: set RERANK_MODE = \"colbert\" and run "
+                         "`python -m src.vector_db migrate` first.")
+    reranker = engine.get_reranker()
+    if reranker is None:
+        raise SystemExit("Cross-encoder reranker could not be loaded.")
+    encoder = engine.query_encoder
+    queries = load_queries(args.queries)
+
+    timings = {"cross_encoder": [], "colbert": []}
+    quality = {"cross_encoder": [], "colbert": [], "overlap": []}
+    for item in queries:
+        query = item["query"]
+        query_filter = build_user_filter(args.user_id)
+        encoder.encode(query)  # both paths use the cached query encoding
+
+        def run_cross_encoder():
+            return list(reranker.compress_documents(engine.search(query, user_id=args.user_id), query))
+
+        def run_colbert():
+            return colbert_rerank_search(engine.client, encoder.encode(query), query_filter, k=args.k)
+
+        results = {}
+        for name, run in (("cross_encoder", run_cross_encoder), ("colbert", run_colbert)):
+            results[name] = _ids(run())  # warm-up
+            for _ in range(args.repeats):
+                start_time = time.perf_counter()
+                run()
+                timings[name].append((time.perf_counter() - start_time) * 1000)
+
+        if item.get("relevant_ids"):
+            gains = {str(point_id): 1.0 for point_id in item["relevant_ids"]}
+            quality["cross_encoder"].append(ndcg_at_k(results["cross_encoder"], gains, args.k))
+        else:
+            # Cross-encoder ranking as the reference (graded by rank)
+            reference = results["cross_encoder"][:args.k]
+            gains = {point_id: 1.0 / (rank + 1) for rank, point_id in enumerate(reference)}
+        quality["colbert"].append(ndcg_at_k(results["colbert"], gains, args.k))
+        top_ce, top_cb = set(results["cross_encoder"][:args.k]), set(results["colbert"][:args.k])
+        quality["overlap"].append(len(top_ce & top_cb) / max(1, len(top_ce)))
+
+    def fmt(values):
+        return f"{np.mean(values):.3f}" if values else "-"
+
+    print(f"\n📊 Reranking per turn ({len(queries)} queries, k={args.k}, search included)")
+    print(f"{'method':>14} {'p50 ms':>8} {'p95 ms':>8} {'nDCG':>6}")
+    for name in ("cross_encoder", "colbert"):
+        print(f"{name:>14} {np.percentile(timings[name], 50):>8.0f} {np.percentile(timings[name], 95):>8.0f} "
+              f"{fmt(quality[name]):>6}")
+    print(f"   Top-{args.k} overlap ColBERT vs cross-encoder: {fmt(quality['overlap'])}")
+    if not quality["cross_encoder"]:
+        print("   (no relevance labels: ColBERT nDCG is measured against the cross-encoder ranking)")
+
+if __name__ == "__main__":
+    main()
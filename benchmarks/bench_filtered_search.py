@@ -0,0 +1,158 @@
+"""
+Filtered-search latency as the chunk collection grows (10k -> 1M points).
+
+At each size the same queries run twice:
+  legacy   three-way `should` over metadata.user_id, no payload indexes
+  indexed  single MatchAny on the keyword tenant index (+ source index)
+
+Payload indexes only take effect on a Qdrant server, so point --url at one
+(e.g. `docker run -p 6333:6333 qdrant/qdrant`); embedded mode (the default
+here) still runs but both variants fall back to a full scan.
+
+    python -m benchmarks.bench_filtered_search --url http://localhost:6333
+    python -m benchmarks.bench_filtered_search --sizes 10000,100000 --dim 256
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.config import GLOBAL_TENANT, LEGACY_TENANT
+
+COLLECTION = "bench_filtered_search"
+VECTOR_NAME = "dense"
+
+def _percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+def _random_vectors(rng, n, dim):
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def _tenant_for(rng, n, users, global_share):
+    # A share of the corpus is global, the rest spread evenly over the users
+    tenants = np.array([f"user_{i}" for i in range(users)] + [GLOBAL_TENANT])
+    weights = np.full(len(tenants), (1 - global_share) / users)
+    weights[-1] = global_share
+    return rng.choice(tenants, size=n, p=weights)
+
+def legacy_filter(user_id):
+    return models.Filter(should=[
+        models.FieldCondition(key="metadata.user_id", match=models.MatchValue(value=value))
+        for value in (user_id, GLOBAL_TENANT, LEGACY_TENANT)
+    ])
+
+def indexed_filter(user_id):
+    return models.Filter(must=[
+        models.FieldCondition(key="metadata.user_id", match=models.MatchAny(any=[user_id, GLOBAL_TENANT]))
+    ])
+
+def grow(client, rng, start, end, dim, users, global_share, batch_size):
+    """Append points [start, end) to the benchmark collection."""
+    for offset in range(start, end, batch_size):
+        n = min(batch_size, end - offset)
+        vectors = _random_vectors(rng, n, dim)
+        tenants = _tenant_for(rng, n, users, global_share)
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[
+                models.PointStruct(
+                    id=offset + i,
+                    vector={VECTOR_NAME: vectors[i].tolist()},
+                    payload={"page_content": "", "metadata": {
+                        "user_id": str(tenants[i]),
+                        "source": f"doc_{(offset + i) // 500}.pdf",
+                    }}
+                )
+                for i in range(n)
+            ],
+            wait=True
+        )
+
+def measure(client, queries, users, make_filter, k):
+    latencies = []
+    for i, query in enumerate(queries):
+        user_id = f"user_{i % users}"
+        start_time = time.perf_counter()
+        client.query_points(
+            collection_name=COLLECTION,
+            query=query.tolist(),
+            using=VECTOR_NAME,
+            query_filter=make_filter(user_id),
+            limit=k,
+            with_payload=False
+        )
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return {"p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95)}
+
+def set_indexes(client, enabled):
+    if enabled:
+        client.create_payload_index(
+            COLLECTION, "metadata.user_id",
+            field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+            wait=True
+        )
+        client.create_payload_index(
+            COLLECTION, "metadata.source",
+            field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD),
+            wait=True
+        )
+    else:
+        for field_name in (client.get_collection(COLLECTION).payload_schema or {}):
+            client.delete_payload_index(COLLECTION, field_name, wait=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tenant-filtered search latency vs collection size.")
+    parser.add_argument("--url", default=None, help="Qdrant server URL (default: in-memory embedded Qdrant)")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated collection sizes")
+    parser.add_argument("--dim", type=int, default=1024, help="Vector size (bge-m3: 1024)")
+    parser.add_argument("--users", type=int, default=100, help="Number of tenants")
+    parser.add_argument("--global-share", type=float, default=0.2, help="Fraction of GLOBAL points")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(":memory:")
+    rng = np.random.default_rng(args.seed)
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    client.create_collection(
+        collection_name=COLLECTION,
+        vectors_config={VECTOR_NAME: models.VectorParams(size=args.dim, distance=models.Distance.COSINE)}
+    )
+    queries = _random_vectors(rng, args.queries, args.dim)
+
+    rows = []
+    current = 0
+    try:
+        for size in sizes:
+            print(f"⏳ Growing collection to {size:,} points...")
+            grow(client, rng, current, size, args.dim, args.users, args.global_share, args.batch_size)
+            current = size
+
+            set_indexes(client, False)
+            legacy = measure(client, queries, args.users, legacy_filter, args.k)
+            set_indexes(client, True)
+            indexed = measure(client, queries, args.users, indexed_filter, args.k)
+            rows.append((size, legacy, indexed))
+            print(f"   {size:>9,} points: legacy p50 {legacy['p50_ms']:.1f} ms / p95 {legacy['p95_ms']:.1f} ms  |  "
+                  f"indexed p50 {indexed['p50_ms']:.1f} ms / p95 {indexed['p95_ms']:.1f} ms")
+    finally:
+        client.delete_collection(COLLECTION)
+
+    print("\n📊 Filtered search latency (ms)")
+    print(f"{'points':>10} {'legacy p50':>11} {'legacy p95':>11} {'indexed p50':>12} {'indexed p95':>12} {'speedup':>8}")
+    for size, legacy, indexed in rows:
+        speedup = legacy["p50_ms"] / indexed["p50_ms"] if indexed["p50_ms"] else 0.0
+        print(f"{size:>10,} {legacy['p50_ms']:>11.1f} {legacy['p95_ms']:>11.1f} "
+              f"{indexed['p50_ms']:>12.1f} {indexed['p95_ms']:>12.1f} {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Recall@k vs latency vs RAM for the dense vector storage modes (float32 / int8 / binary).
+
+Each mode gets its own collection built from the same vectors; recall is measured
+against exact (brute-force) float32 neighbours. Vectors are either sampled from the
+live chunk collection (--from-db, realistic) or synthetic clustered unit vectors.
+Quantization only exists on a Qdrant server, so point --url at one:
+
+    python -m benchmarks.bench_quantization --url http://localhost:6333 --points 200000
+    python -m benchmarks.bench_quantization --url http://localhost:6333 --from-db
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.config import COLLECTION_NAME, DB_PATH
+from src.vector_db import quantization_config
+
+MODES = ("float32", "int8", "binary")
+VECTOR_NAME = "dense"
+
+def _percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+def _normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def synthetic_vectors(rng, n, dim, clusters=256):
+    # Clustered data is closer to real embeddings than isotropic noise
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return _normalize(centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32))
+
+def vectors_from_db(limit):
+    """Dense vectors of the local chunk collection (stop the app first: embedded storage is locked)."""
+    client = QdrantClient(path=DB_PATH)
+    vectors, offset = [], None
+    while len(vectors) < limit:
+        points, offset = client.scroll(COLLECTION_NAME, limit=1000, offset=offset, with_payload=False, with_vectors=True)
+        for point in points:
+            vector = point.vector if isinstance(point.vector, list) else next(iter(point.vector.values()))
+            if isinstance(vector, list):
+                vectors.append(vector)
+        if offset is None:
+            break
+    client.close()
+    return _normalize(np.asarray(vectors[:limit], dtype=np.float32))
+
+def ram_estimate_mb(mode, n, dim):
+    """Vector bytes held in RAM (HNSW graph excluded; originals on disk for quantized modes)."""
+    bytes_per_vector = {"float32": dim * 4, "int8": dim, "binary": dim / 8}[mode]
+    return n * bytes_per_vector / (1024 * 1024)
+
+def build(client, name, mode, vectors, batch_size):
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(
+        collection_name=name,
+        vectors_config={VECTOR_NAME: models.VectorParams(
+            size=vectors.shape[1], distance=models.Distance.COSINE, on_disk=mode != "float32"
+        )},
+        quantization_config=quantization_config(mode)
+    )
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        client.upsert(
+            collection_name=name,
+            points=[models.PointStruct(id=start + i, vector={VECTOR_NAME: v.tolist()}) for i, v in enumerate(batch)],
+            wait=True
+        )
+    # Wait for the optimizer to finish indexing/quantizing before measuring
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(1)
+
+def measure(client, name, queries, truth, k, search_params):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        result = client.query_points(
+            collection_name=name,
+            query=query.tolist(),
+            using=VECTOR_NAME,
+            limit=k,
+            search_params=search_params,
+            with_payload=False
+        )
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        hits += len({point.id for point in result.points} & expected)
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector storage modes.")
+    parser.add_argument("--url", default=None, help="Qdrant server URL (default: in-memory embedded Qdrant)")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--from-db", action="store_true", help="Use vectors from the local chunk collection")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversampling", default="1.0,2.0,4.0", help="Comma-separated oversampling factors")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_db:
+        corpus = vectors_from_db(args.points + args.queries)
+        queries, vectors = corpus[:args.queries], corpus[args.queries:]
+    else:
+        vectors = synthetic_vectors(rng, args.points, args.dim)
+        queries = synthetic_vectors(rng, args.queries, args.dim)
+    print(f"📐 {len(vectors):,} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    # Exact neighbours (cosine on unit vectors = dot product)
+    truth = []
+    for start in range(0, len(queries), 64):
+        scores = queries[start:start + 64] @ vectors.T
+        top = np.argpartition(-scores, args.k, axis=1)[:, :args.k]
+        truth.extend(set(row.tolist()) for row in top)
+
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(":memory:")
+    oversampling = [float(x) for x in args.oversampling.split(",")]
+    rows = []
+    for mode in MODES:
+        name = f"bench_quantization_{mode}"
+        print(f"⏳ Building {mode} collection...")
+        build(client, name, mode, vectors, args.batch_size)
+        try:
+            if mode == "float32":
+                variants = [("-", None)]
+            else:
+                variants = [("no rescore", models.SearchParams(
+                    quantization=models.QuantizationSearchParams(rescore=False)))]
+                variants += [(f"rescore x{factor:g}", models.SearchParams(
+                    quantization=models.QuantizationSearchParams(rescore=True, oversampling=factor)))
+                    for factor in oversampling]
+            for label, params in variants:
+                result = measure(client, name, queries, truth, args.k, params)
+                rows.append((mode, label, result, ram_estimate_mb(mode, len(vectors), vectors.shape[1])))
+        finally:
+            client.delete_collection(name)
+
+    print(f"\n📊 Recall@{args.k} vs latency vs RAM")
+    print(f"{'mode':>8} {'search':>13} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7} {'vector RAM MB':>14}")
+    for mode, label, result, ram_mb in rows:
+        print(f"{mode:>8} {label:>13} {result['recall']:>7.3f} {result['p50_ms']:>7.1f} "
+              f"{result['p95_ms']:>7.1f} {ram_mb:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Reranker backends: latency and nDCG vs the fp32 torch path.
+
+Candidates come from the live collection (the retrieval engine's pre-rerank search),
+so ingest some documents first. Queries are read from a JSONL file:
+
+    {"query": "...", "relevant_ids": ["<point id>", ...]}   relevant_ids optional
+
+With relevant_ids, nDCG@k is computed against those labels for every backend.
+Without them, the torch scores are the graded reference and the report shows how
+closely each optimized backend reproduces the torch ranking.
+
+    python -m benchmarks.bench_reranker queries.jsonl --backends torch,onnx,openvino
+"""
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from src.config import TOP_K_RERANK, RERANKER_MAX_LENGTH
+from src.model_registry import get_rss_mb
+from src.reranker import load_reranker
+from src.retrieval import get_retrieval_engine
+
+def dcg(gains):
+    return sum(gain / math.log2(rank + 2) for rank, gain in enumerate(gains))
+
+def ndcg_at_k(ranked_ids, gain_by_id, k):
+    ideal = dcg(sorted(gain_by_id.values(), reverse=True)[:k])
+    if ideal == 0:
+        return 0.0
+    return dcg([gain_by_id.get(point_id, 0.0) for point_id in ranked_ids[:k]]) / ideal
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark reranker backends (latency and nDCG).")
+    parser.add_argument("queries", help="JSONL file with {\"query\", \"relevant_ids\"?} per line")
+    parser.add_argument("--backends", default="torch,onnx", help="Comma-separated: torch,onnx,openvino")
+    parser.add_argument("--user-id", default="GLOBAL", help="Tenant whose documents are searched")
+    parser.add_argument("--k", type=int, default=TOP_K_RERANK, help="nDCG cutoff")
+    parser.add_argument("--max-length", type=int, default=RERANKER_MAX_LENGTH)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per query (after one warm-up)")
+    args = parser.parse_args(argv)
+
+    engine = get_retrieval_engine()
+    queries = load_queries(args.queries)
+    candidates = []
+    for item in queries:
+        docs = engine.search(item["query"], user_id=args.user_id)
+        pairs = [(item["query"], doc.page_content) for doc in docs]
+        ids = [str(doc.metadata.get("_id", doc.id)) for doc in docs]
+        candidates.append((item, pairs, ids))
+    print(f"📐 {len(queries)} queries, {np.mean([len(p) for _, p, _ in candidates]):.1f} candidates each")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" in backends:
+        # Torch first: its scores are the reference when there are no labels
+        backends.remove("torch")
+        backends.insert(0, "torch")
+
+    reference = None
+    rows = []
+    for backend in backends:
+        rss_before = get_rss_mb()
+        start_time = time.time()
+        reranker = load_reranker(backend, max_length=args.max_length)
+        load_s = time.time() - start_time
+        rss_after = get_rss_mb()
+
+        latencies, ndcgs, all_scores = [], [], []
+        for item, pairs, ids in candidates:
+            reranker.score(pairs)  # warm-up
+            for _ in range(args.repeats):
+                start_time = time.perf_counter()
+                scores = reranker.score(pairs)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+            all_scores.append(scores)
+            ranked = [ids[i] for i in np.argsort(scores)[::-1]]
+            if item.get("relevant_ids"):
+                gains = {str(point_id): 1.0 for point_id in item["relevant_ids"]}
+            elif reference is not None:
+                # Graded reference: torch scores mapped to [0, 1]
+                ref = np.asarray(reference[len(all_scores) - 1], dtype=float)
+                span = ref.max() - ref.min() or 1.0
+                gains = {point_id: float((value - ref.min()) / span) for point_id, value in zip(ids, ref)}
+            else:
+                gains = None
+            if gains is not None:
+                ndcgs.append(ndcg_at_k(ranked, gains, args.k))
+        if backend == "torch":
+            reference = all_scores
+
+        rows.append({
+            "backend": backend,
+            "load_s": load_s,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+            "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+            "ndcg": float(np.mean(ndcgs)) if ndcgs else None,
+            "rss_delta_mb": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+        })
+        print(f"   {backend}: p50 {rows[-1]['p50_ms']:.0f} ms")
+        del reranker
+
+    print(f"\n📊 Reranker backends (max_length {args.max_length}, nDCG@{args.k})")
+    print(f"{'backend':>9} {'p50 ms':>8} {'p95 ms':>8} {'nDCG':>6} {'load s':>7} {'RSS +MB':>8}")
+    for row in rows:
+        ndcg = f"{row['ndcg']:.3f}" if row["ndcg"] is not None else "-"
+        rss = f"{row['rss_delta_mb']:.0f}" if row["rss_delta_mb"] is not None else "-"
+        print(f"{row['backend']:>9} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {ndcg:>6} {row['load_s']:>7.1f} {rss:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config import ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_SIZE, GLOBAL_TENANT
+from src.vector_db import get_data_version
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+def answer_scope(docs, user_id):
+    """Answers grounded only in GLOBAL chunks are shareable across users; others stay per user."""
+    if docs and all(doc.metadata.get("user_id") == GLOBAL_TENANT for doc in docs):
+        return GLOBAL_TENANT
+    return user_id
+
+def evidence_ids(docs):
+    """Point IDs of the retrieved chunks (order-independent)."""
+    return frozenset(str(doc.metadata.get("_id", doc.id)) for doc in docs)
+
+class AnswerCache:
+    """
+    (query embedding, tenant scope, data version, retrieved chunk IDs) -> answer.
+
+    Entries are grouped by (scope, evidence set): a lookup only compares the query
+    embedding against answers built from exactly the same chunks. Everything is
+    dropped when the data version changes (ingest/delete).
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_SIMILARITY, max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._groups = OrderedDict()  # (scope, evidence) -> [(vector, answer, created_at), ...]
+        self._size = 0
+        self._version = get_data_version()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        version = get_data_version()
+        if version != self._version:
+            self._groups.clear()
+            self._size = 0
+            self._version = version
+
+    def lookup(self, query_vector, docs, user_id):
+        """Cached answer for this query and evidence, or None."""
+        if not docs:
+            return None
+        key = (answer_scope(docs, user_id), evidence_ids(docs))
+        vector = np.asarray(query_vector, dtype=np.float32)
+        with self._lock:
+            self._check_version()
+            best, best_score = None, self.threshold
+            for cached_vector, answer, _ in self._groups.get(key, ()):
+                # bge-m3 vectors are normalized: dot product = cosine similarity
+                score = float(np.dot(cached_vector, vector))
+                if score >= best_score:
+                    best, best_score = answer, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._groups.move_to_end(key)
+            self.hits += 1
+        logger.info(f"💨 Answer cache hit (similarity {best_score:.3f}, scope {key[0]})")
+        return best
+
+    def store(self, query_vector, docs, user_id, answer: str, data_version: int):
+        """Cache `answer`; `data_version` is the version the evidence was retrieved at."""
+        if not docs or not answer:
+            return
+        key = (answer_scope(docs, user_id), evidence_ids(docs))
+        with self._lock:
+            self._check_version()
+            if data_version != self._version:
+                # Documents changed while the answer was generated
+                return
+            self._groups.setdefault(key, []).append(
+                (np.asarray(query_vector, dtype=np.float32), answer, time.time())
+            )
+            self._groups.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries:
+                _, evicted = self._groups.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    """Process-wide answer cache shared by all sessions."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
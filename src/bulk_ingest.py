@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.ingestion import ingest_file
+from src.markdown_cache import file_hash
+from src.utils import setup_logger
+from src.config import GLOBAL_TENANT
+
+logger = setup_logger(__name__)
+
+DEFAULT_EXTENSIONS = (".pdf", ".docx")
+CHECKPOINT_DIR = "./ingest_checkpoints"
+
+class Checkpoint:
+    """
+    Append-only JSONL log of bulk ingestion progress.
+
+    {"type": "batch", "file": ..., "hash": ..., "ids": [...]}   one per stored batch
+    {"type": "done",  "file": ..., "hash": ..., "chunks": N}     one per finished file
+
+    Entries are keyed by (path, content hash): a file edited since the last run
+    is ingested again rather than treated as done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {}
+        self.batch_ids = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+                    key = (record["file"], record["hash"])
+                    if record["type"] == "done":
+                        self.done[key] = record
+                    elif record["type"] == "batch":
+                        self.batch_ids.setdefault(key, set()).update(record["ids"])
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _append(self, record):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_batch(self, file_path, content_hash, ids):
+        self._append({"type": "batch", "file": file_path, "hash": content_hash, "ids": list(ids)})
+
+    def record_done(self, file_path, content_hash, chunks, seconds):
+        record = {"type": "done", "file": file_path, "hash": content_hash,
+                  "chunks": chunks, "seconds": round(seconds, 2)}
+        self._append(record)
+        self.done[(file_path, content_hash)] = record
+
+def find_documents(directory: str, extensions=DEFAULT_EXTENSIONS):
+    """All matching files under `directory`, largest first so long files start early."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(extensions):
+                paths.append(os.path.join(root, name))
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def run_bulk_ingest(directory: str, user_id: str = GLOBAL_TENANT, workers: int = 1,
+                    checkpoint_path: str = None, extensions=DEFAULT_EXTENSIONS):
+    """Ingest every document under `directory`, resuming from the checkpoint if present."""
+    directory = os.path.abspath(directory)
+    if checkpoint_path is None:
+        dir_key = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:12]
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{dir_key}.jsonl")
+    checkpoint = Checkpoint(checkpoint_path)
+
+    paths = find_documents(directory, extensions)
+    logger.info(f"📂 Found {len(paths)} documents in {directory} (checkpoint: {checkpoint_path})")
+
+    results = {"done": [], "skipped": [], "failed": []}
+    wall_start = time.time()
+
+    def ingest_one(path):
+        content_hash = file_hash(path)
+        if (path, content_hash) in checkpoint.done:
+            return "skipped", path, 0, 0.0
+        # Batches stored before a crash are not embedded or written again
+        resume_ids = checkpoint.batch_ids.get((path, content_hash), set())
+        if resume_ids:
+            logger.info(f"⏩ Resuming {os.path.basename(path)}: {len(resume_ids)} chunks already stored")
+
+        start_time = time.time()
+        chunks = ingest_file(
+            path,
+            user_id=user_id,
+            original_filename=os.path.relpath(path, directory),
+            skip_ids=resume_ids,
+            on_batch=lambda batch: checkpoint.record_batch(path, content_hash, [doc.id for doc in batch])
+        ) or 0
+        elapsed = time.time() - start_time
+        checkpoint.record_done(path, content_hash, chunks, elapsed)
+        return "done", path, chunks, elapsed
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bulk-ingest") as pool:
+        futures = {pool.submit(ingest_one, path): path for path in paths}
+        for i, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                status, _, chunks, elapsed = future.result()
+                results[status].append({"file": path, "chunks": chunks, "seconds": elapsed})
+                if status == "done":
+                    logger.info(f"[{i}/{len(paths)}] ✅ {os.path.basename(path)}: {chunks} chunks in {elapsed:.1f}s")
+            except Exception as e:
+                results["failed"].append({"file": path, "error": str(e)})
+                logger.error(f"[{i}/{len(paths)}] ❌ {os.path.basename(path)}: {e}")
+
+    wall_s = time.time() - wall_start
+    latencies = [r["seconds"] for r in results["done"]]
+    total_chunks = sum(r["chunks"] for r in results["done"])
+    summary = {
+        "files_done": len(results["done"]),
+        "files_skipped": len(results["skipped"]),
+        "files_failed": len(results["failed"]),
+        "chunks": total_chunks,
+        "wall_s": round(wall_s, 1),
+        "chunks_per_s": round(total_chunks / wall_s, 1) if wall_s > 0 else 0.0,
+        "files_per_hour": round(len(latencies) / wall_s * 3600, 1) if wall_s > 0 else 0.0,
+        "latency_p50_s": round(_percentile(latencies, 50), 1),
+        "latency_p95_s": round(_percentile(latencies, 95), 1),
+        "latency_max_s": round(max(latencies), 1) if latencies else 0.0,
+        "failed": results["failed"],
+    }
+    return summary
+
+def print_summary(summary):
+    print("\n📊 Bulk ingestion summary")
+    print(f"   Files:      {summary['files_done']} ingested, {summary['files_skipped']} already done, "
+          f"{summary['files_failed']} failed")
+    print(f"   Chunks:     {summary['chunks']:,} in {summary['wall_s']}s "
+          f"({summary['chunks_per_s']} chunks/s, {summary['files_per_hour']} files/h)")
+    print(f"   Latency:    p50 {summary['latency_p50_s']}s • p95 {summary['latency_p95_s']}s "
+          f"• max {summary['latency_max_s']}s per file")
+    for failure in summary["failed"]:
+        print(f"   ❌ {failure['file']}: {failure['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of documents into the vector store.")
+    parser.add_argument("directory", help="Directory to scan recursively")
+    parser.add_argument("--user-id", default=GLOBAL_TENANT, help=f"Owner of the ingested documents (default: {GLOBAL_TENANT})")
+    parser.add_argument("--workers", type=int, default=1, help="Files ingested concurrently (default: 1)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: per-directory file in ./ingest_checkpoints)")
+    parser.add_argument("--extensions", default=",".join(ext.lstrip(".") for ext in DEFAULT_EXTENSIONS),
+                        help="Comma-separated file extensions (default: pdf,docx)")
+    args = parser.parse_args(argv)
+
+    extensions = tuple(f".{ext.strip().lstrip('.').lower()}" for ext in args.extensions.split(",") if ext.strip())
+    summary = run_bulk_ingest(args.directory, user_id=args.user_id, workers=args.workers,
+                              checkpoint_path=args.checkpoint, extensions=extensions)
+    print_summary(summary)
+    return 1 if summary["files_failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,7 +7,58 @@ DB_PATH = "./qdrant_db"
 
 # Embedding
 EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+EMBEDDING_DIM = 1024
 DEVICE = "cpu" # or cuda
+# Sparse (lexical) terms kept per chunk in the embedding cache
+SPARSE_CACHE_MAX_TERMS = 256
+
+# Embedding cache (content-addressed, persistent across ingestions)
+EMBEDDING_CACHE_DIR = "./embedding_cache"
+EMBEDDING_CACHE_MAX_MB = 2048
+# ColBERT multi-vectors (RERANK_MODE = "colbert"), one float16 file per chunk, ~0.5 MB each
+EMBEDDING_CACHE_COLBERT_MAX_MB = 8192
+
+# Ingestion pipeline
+# Worker processes for embedding (1 = embed in-process, no pool)
+EMBEDDING_WORKERS = 1
+# torch threads pinned per embedding worker process
+EMBEDDING_THREADS_PER_WORKER = 4
+# Max batches buffered between chunking -> embedding -> upsert stages
+PIPELINE_QUEUE_SIZE = 8
+
+# Background ingestion jobs
+INGEST_JOBS_PATH = "./ingest_jobs.json"
+# Documents ingested at the same time; the rest wait in the queue
+MAX_CONCURRENT_INGESTS = 1
+# Scheduling priority of ingestion threads and embedding worker processes (Linux nice value)
+INGEST_NICENESS = 10
+# The embed stage shares bge-m3 (and torch's thread pools) with live queries: it encodes in
+# slices of this many chunks and, before each slice, waits for running query encodes/reranks
+# to finish (at most INGEST_YIELD_MAX_S, so ingestion never stalls under constant traffic)
+INGEST_EMBED_SLICE = 8
+INGEST_YIELD_MAX_S = 2.0
+
+# Reranker
+RERANKER_MODEL_NAME = "BAAI/bge-reranker-v2-m3"
+# "torch" (fp32), "onnx" (int8 dynamically quantized ONNX Runtime) or "openvino"
+RERANKER_BACKEND = "torch"
+# Tokens per (query, chunk) pair; longer pairs are truncated
+RERANKER_MAX_LENGTH = 512
+# Pairs are sorted by token length and scored in batches of this size (less padding)
+RERANKER_BATCH_SIZE = 16
+# ONNX int8 kernel target: "avx512_vnni", "avx512", "avx2" or "arm64"
+RERANKER_ONNX_QUANTIZATION = "avx512_vnni"
+# Exported ONNX / OpenVINO models are written here once and reused
+RERANKER_EXPORT_DIR = "./reranker_export"
+
+# Conversion
+# PDFs are converted in page ranges of this size and chunked as each range finishes
+PAGES_PER_SLICE = 20
+# Worker processes converting page ranges in parallel (1 = convert in-process)
+CONVERSION_WORKERS = 1
+# Converted markdown cache (keyed by file content hash), so re-chunking skips Docling
+MARKDOWN_CACHE_DIR = "./markdown_cache"
+MARKDOWN_CACHE_MAX_MB = 1024
 
 # Chunking (optimized for large PDFs - 500+ pages)
 CHUNK_SIZE = 1000      # Larger chunks = fewer embeddings to compute
@@ -16,11 +67,143 @@ CHUNK_OVERLAP = 200    # Good overlap for context preservation
 # Retrieval
 TOP_K_RETRIEVAL = 10
 TOP_K_RERANK = 3
+# "hybrid" = dense + bge-m3 sparse fused server-side, "dense" = dense MMR only
+RETRIEVAL_MODE = "hybrid"
+HYBRID_FUSION = "rrf"  # "rrf" or "dbsf"
+HYBRID_PREFETCH_K = 20  # candidates fetched per vector type before fusion
+# Per-(user, query) result cache of the shared retrieval engine, cleared on data version change
+RETRIEVAL_CACHE_SIZE = 256
+# Reranking of the retrieved candidates:
+# "cross_encoder" = bge-reranker forward pass per (query, chunk) pair
+# "colbert"       = bge-m3 multi-vectors stored at ingest, MaxSim rerank inside Qdrant
+#                   (no reranker model; needs `python -m src.vector_db migrate` on old collections)
+RERANK_MODE = "cross_encoder"
+# Dense-only MMR candidates
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+# Adaptive reranking (cross-encoder mode), decided from the dense cosine scores of the candidates:
+#   top1 - top2 >= SKIP_MARGIN   -> decisive, no rerank
+#   top1 - top2 >= SHORT_MARGIN  -> rerank only the best SHORT_RERANK_K candidates
+#   top1 - topK <= FLAT_SPREAD   -> flat scores, widen the candidate pool by WIDEN_FACTOR, full rerank
+# Every decision is appended to ADAPTIVE_DECISION_LOG (JSONL) for latency/quality analysis, by a
+# background thread, rotated at MAX_MB (BACKUPS old files kept). Queries and user IDs are logged
+# as hashes unless ADAPTIVE_DECISION_LOG_RAW_QUERIES is set.
+ADAPTIVE_RERANK = True
+ADAPTIVE_SKIP_MARGIN = 0.08
+ADAPTIVE_SHORT_MARGIN = 0.04
+ADAPTIVE_SHORT_RERANK_K = 5
+ADAPTIVE_FLAT_SPREAD = 0.02
+ADAPTIVE_WIDEN_FACTOR = 2
+ADAPTIVE_DECISION_LOG = "./retrieval_decisions.jsonl"
+ADAPTIVE_DECISION_LOG_MAX_MB = 50
+ADAPTIVE_DECISION_LOG_BACKUPS = 3
+ADAPTIVE_DECISION_LOG_RAW_QUERIES = False
+# Query embeddings: LRU + TTL cache on normalized query text, and micro-batching of
+# concurrent queries (encodings arriving within the window share one forward pass)
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL_S = 3600
+QUERY_BATCH_WINDOW_MS = 5
+QUERY_BATCH_MAX_SIZE = 32
+
+# Semantic answer cache: reuse an answer when a similar query (cosine >= threshold) in the
+# same tenant scope retrieved exactly the same chunks. Never used with user memory context.
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_SIZE = 1024
+
+# Prompt context packing: chunks of the same section are merged (overlap and repeated
+# "[Context: ...]" prefixes removed) and packed in rank order up to MAX_TOKENS (LLM tokenizer)
+CONTEXT_PACKING = True
+CONTEXT_MAX_TOKENS = 2048
+CONTEXT_MIN_PARTIAL_TOKENS = 64  # a section that does not fit is truncated only if this much room is left
+
+# Chat turn: retrieval and memory lookup run concurrently; a stage that misses its
+# deadline is dropped (no documents / no memory) instead of delaying the answer
+QUERY_PIPELINE_WORKERS = 8
+RETRIEVAL_TIMEOUT_S = 30
+MEMORY_TIMEOUT_S = 5
+
+# mem0 storage (embedded Qdrant; unused when QDRANT_URL is set)
+MEM0_STORAGE_PATH = "./mem0_storage_v4"
+
+# User memory writes: interactions go to a journaled background queue and are written to
+# mem0 in per-user batches (one fact-extraction call per batch) instead of after every answer
+MEMORY_WRITE_ASYNC = True
+MEMORY_WRITE_JOURNAL = "./memory_write_journal.jsonl"
+MEMORY_WRITE_IDLE_S = 20        # a user's batch is written after this long without new turns...
+MEMORY_WRITE_MAX_DELAY_S = 120  # ...or once its oldest interaction has waited this long
+MEMORY_WRITE_MAX_BATCH = 8      # interactions per extraction call
+MEMORY_WRITE_RETRY_BACKOFF_S = 5
+MEMORY_WRITE_SHUTDOWN_TIMEOUT_S = 60  # flush budget at exit; unwritten turns stay journaled
+MEMORY_WRITE_JOURNAL_MAX_MB = 8  # journal rewritten down to the unwritten turns past this size
+
+# User memory context: pinned profile facts + the most query-relevant memories, within a
+# token budget. Each user's memories (and their vectors) are cached until they change.
+MEMORY_CONTEXT_MAX_TOKENS = 400
+MEMORY_CONTEXT_TOP_K = 8
+MEMORY_CONTEXT_MIN_SIMILARITY = 0.35  # cosine; weaker matches are left out
+MEMORY_CONTEXT_MAX_PINNED = 5
+MEMORY_CONTEXT_FETCH_LIMIT = 1000  # memories loaded per user when (re)filling the cache
+MEMORY_CONTEXT_CACHE_USERS = 128  # users whose memories (float16 vectors) stay cached, least recently used evicted
+# Profile facts always included, whatever the question (case-insensitive regexes)
+MEMORY_PINNED_PATTERNS = [
+    r"\bname\b", r"\bcalled\b", r"\btên\b",
+    r"\brole\b", r"\bworks? as\b", r"\bjob\b", r"\boccupation\b", r"\bposition\b",
+    r"\bvai trò\b", r"\bnghề\b", r"\bchức vụ\b", r"\blàm việc\b",
+]
+
+# Memory consolidation (`python -m src.memory_consolidation`, or in-app every INTERVAL hours):
+# a memory is deleted only as a near-exact duplicate (cosine >= SIMILARITY and no word the
+# kept memory lacks), and raw conversational fragments ("User: ... System: ...") older than
+# FRAGMENT_TTL_DAYS expire. In-app runs go through the memory writer thread, once per
+# interval across replicas, and only report until APPLY is set (validate with the CLI first).
+MEMORY_CONSOLIDATION_SIMILARITY = 0.97
+MEMORY_FRAGMENT_TTL_DAYS = 30
+MEMORY_CONSOLIDATION_INTERVAL_H = 24  # 0 = only run from the CLI
+MEMORY_CONSOLIDATION_APPLY = False
 
 # LLM
 LLM_MODEL_NAME = "qwen2.5:14b" # Ollama model name
+# Hugging Face tokenizer matching the Ollama model, used to measure prompt budgets
+LLM_TOKENIZER_NAME = "Qwen/Qwen2.5-14B-Instruct"
 LLM_TEMP = 0.1
 BASE_URL = "http://localhost:11434"
 
 # Qdrant
+# Server endpoint (e.g. "http://localhost:6333"); unset = embedded storage at DB_PATH,
+# which locks the directory to one process. A server lets several app replicas share it.
+QDRANT_URL = os.getenv("QDRANT_URL") or None
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") or None
+QDRANT_PREFER_GRPC = True
+QDRANT_GRPC_PORT = 6334
+QDRANT_TIMEOUT = 30
+# Server mode: upsert batches in flight at once, and retries (exponential backoff) per batch
+UPSERT_PARALLEL = 4
+UPSERT_MAX_RETRIES = 3
+UPSERT_RETRY_BACKOFF_S = 0.5
 COLLECTION_NAME = "antigravity_rag"
+# Dense vector storage: "float32" (full vectors in RAM), "int8" (scalar quantization,
+# ~4x less RAM) or "binary" (1 bit/dim, ~32x less RAM). Quantized modes keep the
+# original vectors on disk (memory-mapped) and rescore the top candidates with them.
+# Apply to an existing collection with `python -m src.vector_db storage`.
+VECTOR_STORAGE_MODE = "float32"
+VECTORS_ON_DISK = True
+QUANTIZATION_RESCORE = True
+QUANTIZATION_OVERSAMPLING = 2.0  # candidates fetched from quantized vectors per result before rescoring
+DENSE_VECTOR_NAME = "dense"
+SPARSE_VECTOR_NAME = "sparse"
+COLBERT_VECTOR_NAME = "colbert"
+# Tenant value shared by every user (legacy "default" points are normalized to it)
+GLOBAL_TENANT = "GLOBAL"
+LEGACY_TENANT = "default"
+# One point per source document: owner + current chunk IDs (for incremental re-ingestion)
+MANIFEST_COLLECTION_NAME = f"{COLLECTION_NAME}_manifest"
+# Server mode: the data version (and per-user memory versions) that invalidate every cache
+# live in this collection, so a change made by one app replica reaches all of them.
+# Replicas re-read a version at most every DATA_VERSION_REFRESH_S (0 = on every cache check).
+# Embedded mode keeps them in the process. Local files (INGEST_JOBS_PATH, MEMORY_WRITE_JOURNAL,
+# caches) are per replica: give each replica its own working directory.
+STATE_COLLECTION_NAME = f"{COLLECTION_NAME}_state"
+DATA_VERSION_REFRESH_S = 1.0
+# Documents per page in the admin document list
+DOCUMENT_PAGE_SIZE = 20
@@ -0,0 +1,112 @@
+import re
+
+from src.config import CHUNK_SIZE, CONTEXT_MAX_TOKENS, CONTEXT_MIN_PARTIAL_TOKENS
+from src.model_registry import count_tokens
+from src.utils import setup_logger, normalize_text
+
+logger = setup_logger(__name__)
+
+# Prefix added to every chunk at ingestion (see iter_chunks)
+_CONTEXT_PREFIX_RE = re.compile(r"^\[Context: [^\n]*\]\n\n")
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence
+_MIN_OVERLAP = 20
+
+def strip_context_prefix(text: str) -> str:
+    return _CONTEXT_PREFIX_RE.sub("", text, count=1)
+
+def _section_key(doc):
+    """
+    ((source, header path, section index), chunk index within the section).
+    chunk_id is not unique (unchanged chunks keep the numbering of the run that stored
+    them), so the header path is part of the key; legacy chunks get their own section.
+    """
+    source = doc.metadata.get("source", "")
+    header = doc.metadata.get("header_path") or "General"
+    try:
+        section, part = (int(n) for n in str(doc.metadata.get("chunk_id", "")).split("_"))
+    except ValueError:
+        return (source, header, f"doc-{id(doc)}"), 0
+    return (source, header, section), part
+
+def merge_overlapping(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the text the splitter repeated at the start of `second`."""
+    for size in range(min(len(first), len(second), CHUNK_SIZE), _MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` within `max_tokens`, cut at a whitespace boundary."""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    boundary = cut.rfind(" ")
+    return (cut[:boundary] if boundary > 0 else cut).rstrip() + " …"
+
+def pack_context(docs, max_tokens: int = CONTEXT_MAX_TOKENS):
+    """
+    Build the prompt context from reranked `docs` (best first).
+
+    Chunks from the same document section are merged in reading order under a single
+    "[Context: source > headers]" line, with the splitter overlap removed. Sections are
+    packed by their best-ranked chunk until `max_tokens`; the first section that does not
+    fit is truncated if at least CONTEXT_MIN_PARTIAL_TOKENS remain, otherwise skipped.
+    Returns (context, stats).
+    """
+    sections = {}  # (source, header, section) -> {"rank", "source", "header", "parts": [(part, rank, body)]}
+    seen = set()
+    for rank, doc in enumerate(docs):
+        body = strip_context_prefix(doc.page_content).strip()
+        if not body or normalize_text(body) in seen:
+            continue
+        seen.add(normalize_text(body))
+        key, part = _section_key(doc)
+        entry = sections.setdefault(key, {"rank": rank, "source": key[0], "header": key[1], "parts": []})
+        # Colliding chunk indices keep both bodies
+        entry["parts"].append((part, rank, body))
+
+    blocks = []
+    for entry in sorted(sections.values(), key=lambda e: e["rank"]):
+        text, previous = "", None
+        for part, _, body in sorted(entry["parts"]):
+            if not text:
+                text = body
+            elif previous is not None and part == previous + 1:
+                text = merge_overlapping(text, body)
+            else:
+                # Not adjacent (or same index): no splitter overlap to remove
+                text = text + "\n\n" + body
+            previous = part
+        label = f"{entry['source']} > {entry['header']}" if entry["source"] else entry["header"]
+        blocks.append((f"[Context: {label}]\n\n", text))
+
+    budget = max_tokens
+    packed = []
+    for label, text in blocks:
+        cost = count_tokens(label + text) + 1
+        if cost <= budget:
+            packed.append(label + text)
+            budget -= cost
+            continue
+        room = budget - count_tokens(label) - 1
+        if room >= CONTEXT_MIN_PARTIAL_TOKENS:
+            packed.append(label + _truncate(text, room))
+            break
+        # Too little room to be useful: a smaller, lower-ranked section may still fit
+
+    context = "\n\n".join(packed)
+    stats = {
+        "chunks": len(docs),
+        "sections": len(blocks),
+        "sections_packed": len(packed),
+        "tokens_raw": sum(count_tokens(doc.page_content) for doc in docs),
+        "tokens": count_tokens(context),
+    }
+    logger.info(f"📦 Packed {stats['chunks']} chunks into {stats['sections_packed']}/{stats['sections']} sections: "
+                f"{stats['tokens_raw']} -> {stats['tokens']} tokens")
+    return context, stats
@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from docling.document_converter import DocumentConverter
+from src.config import PAGES_PER_SLICE, CONVERSION_WORKERS
+from src.markdown_cache import markdown_cache_key, iter_cached_slices, write_through
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+_converter = None
+_converter_lock = threading.Lock()
+
+def get_converter() -> DocumentConverter:
+    """Warm, reused Docling converter (pipeline models load once per process)."""
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            _converter = DocumentConverter()
+        return _converter
+
+def count_pages(file_path: str):
+    """Number of pages for PDFs, None for formats Docling cannot page-range."""
+    if not file_path.lower().endswith(".pdf"):
+        return None
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def iter_page_ranges(num_pages: int, pages_per_slice: int = PAGES_PER_SLICE):
+    """Yield 1-based inclusive (start, end) page ranges covering the document."""
+    for start in range(1, num_pages + 1, pages_per_slice):
+        yield start, min(start + pages_per_slice - 1, num_pages)
+
+def convert_to_markdown(file_path: str, page_range=None) -> str:
+    converter = get_converter()
+    if page_range is None:
+        result = converter.convert(file_path)
+    else:
+        result = converter.convert(file_path, page_range=page_range)
+    return result.document.export_to_markdown()
+
+def _init_conversion_worker(num_threads):
+    """Runs once per worker process: split the cores and warm the converter."""
+    import torch
+    torch.set_num_threads(num_threads)
+    get_converter()
+
+def _convert_range(file_path, start, end):
+    start_time = time.time()
+    markdown = convert_to_markdown(file_path, page_range=(start, end))
+    return markdown, time.time() - start_time
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_conversion_pool(workers: int = CONVERSION_WORKERS) -> ProcessPoolExecutor:
+    """Process pool of warm converters, reused across documents."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            num_threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_conversion_worker,
+                initargs=(num_threads,)
+            )
+            logger.info(f"🧵 Conversion pool: {workers} workers x {num_threads} torch threads")
+        return _pool
+
+def _iter_ranges_sequential(file_path, ranges):
+    for start, end in ranges:
+        yield (start, end), _convert_range(file_path, start, end)
+
+def _iter_ranges_parallel(file_path, ranges, workers):
+    """Convert ranges across the pool, yielding results in page order."""
+    pool = get_conversion_pool(workers)
+    # Bounded lookahead keeps at most a few converted ranges in memory
+    pending = deque()
+    ranges = iter(ranges)
+    for page_range in ranges:
+        pending.append((page_range, pool.submit(_convert_range, file_path, *page_range)))
+        if len(pending) >= workers * 2:
+            break
+    while pending:
+        page_range, future = pending.popleft()
+        next_range = next(ranges, None)
+        if next_range is not None:
+            pending.append((next_range, pool.submit(_convert_range, file_path, *next_range)))
+        yield page_range, future.result()
+
+def iter_markdown_slices(file_path: str, pages_per_slice: int = PAGES_PER_SLICE,
+                         workers: int = CONVERSION_WORKERS, timings: list = None, use_cache: bool = True):
+    """
+    Stream a document as markdown, one page range at a time and in page order, so
+    chunking and embedding can start before the last page is converted. With
+    workers > 1, ranges are converted in parallel by a pool of warm converters.
+    Non-PDF formats and short PDFs are converted in one go.
+    Converted markdown is cached by file content hash, so re-chunking skips Docling.
+    Per-range timings are appended to `timings` when given.
+    """
+    if not use_cache:
+        return _convert_slices(file_path, pages_per_slice, workers, timings)
+
+    key = markdown_cache_key(file_path, pages_per_slice)
+    cached = iter_cached_slices(key)
+    if cached is not None:
+        logger.info(f"⚡ Markdown cache hit for {os.path.basename(file_path)}, skipping Docling")
+        return cached
+    return write_through(key, _convert_slices(file_path, pages_per_slice, workers, timings))
+
+def _convert_slices(file_path, pages_per_slice, workers, timings):
+    if timings is None:
+        timings = []
+    num_pages = count_pages(file_path)
+    if num_pages is None or num_pages <= pages_per_slice:
+        start_time = time.time()
+        markdown = convert_to_markdown(file_path)
+        elapsed = time.time() - start_time
+        timings.append({"pages": None, "seconds": round(elapsed, 2)})
+        logger.info(f"✅ Docling conversion completed in {elapsed:.1f}s ({len(markdown):,} characters)")
+        yield markdown
+        return
+
+    logger.info(f"📚 Streaming {os.path.basename(file_path)}: {num_pages} pages in slices of {pages_per_slice} "
+                f"({workers} conversion worker{'s' if workers > 1 else ''})")
+    ranges = list(iter_page_ranges(num_pages, pages_per_slice))
+    if workers > 1:
+        results = _iter_ranges_parallel(file_path, ranges, workers)
+    else:
+        results = _iter_ranges_sequential(file_path, ranges)
+
+    wall_start = time.time()
+    range_timings = []
+    for (start, end), (markdown, elapsed) in results:
+        range_timings.append({"pages": (start, end), "seconds": round(elapsed, 2)})
+        timings.append(range_timings[-1])
+        logger.info(f"   Pages {start}-{end}/{num_pages} converted in {elapsed:.1f}s "
+                    f"({len(markdown):,} characters)")
+        yield markdown
+
+    busy = sum(t["seconds"] for t in range_timings)
+    slowest = max(t["seconds"] for t in range_timings)
+    logger.info(f"✅ Docling conversion: {len(ranges)} ranges in {time.time() - wall_start:.1f}s wall "
+                f"({busy:.1f}s converter time, slowest range {slowest:.1f}s)")
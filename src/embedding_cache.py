@@ -0,0 +1,401 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List
+
+import numpy as np
+from filelock import FileLock, Timeout
+
+from src.config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_DIM, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_MB, EMBEDDING_CACHE_COLBERT_MAX_MB,
+    RETRIEVAL_MODE, RERANK_MODE, SPARSE_CACHE_MAX_TERMS
+)
+from src.utils import setup_logger, normalize_text
+
+logger = setup_logger(__name__)
+
+# Initial number of slots; the store doubles when full until the size cap
+_INITIAL_CAPACITY = 4096
+# Fraction of entries dropped (least recently used first) when the cap is hit
+_EVICT_FRACTION = 0.1
+# The index snapshot is rewritten once the append-only log has more lines than this and than entries
+_COMPACT_MIN_LINES = 10000
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def _fingerprint(key: str) -> int:
+    # 63-bit fingerprint stored next to each vector slot to detect stale slots
+    return int(key[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding store.
+
+    Records are {"dense": [...]} plus, when `sparse_terms` > 0, {"sparse": {"indices", "values"}}
+    holding the top `sparse_terms` lexical weights. Each part lives in a memory-mapped file with
+    one fixed-size row per slot (dense vectors as float16). The index maps cache keys to
+    (slot, last_used[, colbert bytes]): a snapshot (`index.json`) plus an append-only log
+    (`index.log`, one line per stored or dropped key), folded into the snapshot once it outgrows it.
+    A parallel `keys.i64` file stores a fingerprint per slot so a slot reused after a crash is
+    never served for the wrong key.
+
+    A directory is used by one process at a time (`.lock`); a second process (app, bulk CLI,
+    another replica on the same disk) gets the next free directory (`<name>-2`, ...).
+
+    With `colbert`, records also hold {"colbert": (tokens, dim) float16 array}. Their length
+    varies per text, so each is a `colbert/<key>.npy` file, capped at `colbert_max_mb` in total
+    (least recently used entries evicted).
+    """
+
+    def __init__(self, model_name: str, dim: int, sparse_terms: int = 0, colbert: bool = False,
+                 cache_dir: str = EMBEDDING_CACHE_DIR, max_mb: int = EMBEDDING_CACHE_MAX_MB,
+                 colbert_max_mb: int = EMBEDDING_CACHE_COLBERT_MAX_MB):
+        self.model_name = model_name
+        self.dim = dim
+        self.sparse_terms = sparse_terms
+        self.colbert = colbert
+        dir_name = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12]
+        if sparse_terms:
+            dir_name += f"-sparse{sparse_terms}"
+        if colbert:
+            dir_name += "-colbert"
+        self.dir, self._dir_lock = self._claim_dir(os.path.join(cache_dir, dir_name))
+        self._colbert_dir = os.path.join(self.dir, "colbert")
+        self._colbert_max_bytes = int(colbert_max_mb * 1024 * 1024)
+        self._colbert_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        # name -> (dtype, row shape)
+        self._layout = {
+            "vectors.f16": (np.float16, (dim,)),
+            "keys.i64": (np.int64, ()),
+        }
+        if sparse_terms:
+            self._layout["sparse_idx.i32"] = (np.int32, (sparse_terms,))
+            self._layout["sparse_val.f16"] = (np.float16, (sparse_terms,))
+            self._layout["sparse_nnz.i16"] = (np.int16, ())
+        self._row_bytes = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for dtype, shape in self._layout.values())
+        self.max_entries = max(1, int(max_mb * 1024 * 1024) // self._row_bytes)
+
+        os.makedirs(self._colbert_dir if colbert else self.dir, exist_ok=True)
+        self._index_path = os.path.join(self.dir, "index.json")
+        self._log_path = os.path.join(self.dir, "index.log")
+
+        self._entries = {}  # key -> [slot, last_used] (+ colbert bytes)
+        self._log_lines = 0
+        capacity = _INITIAL_CAPACITY
+        fresh = True
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                if (index.get("dim") == dim and index.get("model") == model_name
+                        and index.get("sparse_terms", 0) == sparse_terms and index.get("colbert", False) == colbert):
+                    self._entries = index.get("entries", {})
+                    capacity = index.get("capacity", capacity)
+                    fresh = False
+                else:
+                    logger.warning(f"⚠️ Embedding cache at {self.dir} has a different layout, starting fresh")
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Could not read embedding cache index ({e}), starting fresh")
+        if not fresh:
+            capacity = max(capacity, self._replay_log())
+
+        self._capacity = 0
+        self._arrays = {}
+        self._open(max(capacity, min(_INITIAL_CAPACITY, self.max_entries)))
+        if fresh:
+            self._write_snapshot_locked()
+        self._log = open(self._log_path, "a", encoding="utf-8")
+
+        used = {entry[0] for entry in self._entries.values()}
+        if colbert:
+            self._colbert_bytes = sum(entry[2] for entry in self._entries.values())
+        self._free = [slot for slot in range(self._capacity - 1, -1, -1) if slot not in used]
+        logger.info(f"🗃️ Embedding cache: {len(self._entries):,} vectors at {self.dir}")
+
+    @staticmethod
+    def _claim_dir(base: str):
+        """First of `base`, `base-2`, ... not held by another process -> (dir, held lock)."""
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        attempt = 1
+        while True:
+            path = base if attempt == 1 else f"{base}-{attempt}"
+            os.makedirs(path, exist_ok=True)
+            lock = FileLock(os.path.join(path, ".lock"))
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                attempt += 1
+                continue
+            if attempt > 1:
+                logger.info(f"🗃️ Embedding cache at {base} is used by another process, using {path}")
+            return path, lock
+
+    def _replay_log(self) -> int:
+        """Apply `index.log` on top of the snapshot; returns the slot count it needs."""
+        if not os.path.exists(self._log_path):
+            return 0
+        needed = 0
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    continue
+                self._log_lines += 1
+                if len(record) == 1:
+                    self._entries.pop(record[0], None)
+                else:
+                    self._entries[record[0]] = record[1:]
+                    needed = max(needed, record[1] + 1)
+        return needed
+
+    def _log_append_locked(self, records):
+        """One line per [key, *entry] (stored) or [key] (dropped). Not fsynced: fingerprints catch a lost tail."""
+        if records:
+            self._log.write("".join(json.dumps(record) + "\n" for record in records))
+            self._log.flush()
+            self._log_lines += len(records)
+            self._dirty = True
+
+    def _open(self, capacity: int):
+        """(Re)open the memory-mapped files, growing them to `capacity` slots."""
+        for array in self._arrays.values():
+            array.flush()
+        for name, (dtype, shape) in self._layout.items():
+            path = os.path.join(self.dir, name)
+            size = capacity * np.dtype(dtype).itemsize * int(np.prod(shape))
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            self._arrays[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,) + shape)
+        self._capacity = capacity
+
+    def _allocate_slot(self) -> int:
+        if not self._free:
+            if self._capacity < self.max_entries:
+                old_capacity = self._capacity
+                self._open(min(self._capacity * 2, self.max_entries))
+                self._free = list(range(self._capacity - 1, old_capacity - 1, -1))
+            else:
+                self._evict(max(1, int(len(self._entries) * _EVICT_FRACTION)))
+        return self._free.pop()
+
+    def _evict(self, count: int):
+        """Drop the `count` least recently used entries."""
+        oldest = sorted(self._entries.items(), key=lambda item: item[1][1])[:count]
+        for key, entry in oldest:
+            del self._entries[key]
+            self._arrays["keys.i64"][entry[0]] = 0
+            self._free.append(entry[0])
+            if self.colbert:
+                self._drop_colbert(key, entry)
+        self._log_append_locked([[key] for key, _ in oldest])
+        self.evictions += len(oldest)
+        logger.info(f"🧹 Embedding cache evicted {len(oldest):,} least recently used vectors")
+
+    def _colbert_path(self, key: str) -> str:
+        return os.path.join(self._colbert_dir, key + ".npy")
+
+    def _drop_colbert(self, key: str, entry):
+        self._colbert_bytes -= entry[2]
+        try:
+            os.remove(self._colbert_path(key))
+        except OSError:
+            pass
+
+    def _read(self, slot: int, key: str):
+        """Cached record in `slot`, None if its ColBERT file is missing (crash, manual cleanup)."""
+        record = {"dense": self._arrays["vectors.f16"][slot].astype(np.float32).tolist()}
+        if self.colbert:
+            try:
+                record["colbert"] = np.load(self._colbert_path(key))
+            except (OSError, ValueError):
+                return None
+        if self.sparse_terms:
+            nnz = int(self._arrays["sparse_nnz.i16"][slot])
+            record["sparse"] = {
+                "indices": self._arrays["sparse_idx.i32"][slot, :nnz].tolist(),
+                "values": self._arrays["sparse_val.f16"][slot, :nnz].astype(np.float32).tolist(),
+            }
+        return record
+
+    def _write(self, slot: int, record: dict, key: str) -> int:
+        """Store `record` in `slot`; returns the bytes of its ColBERT file (0 without)."""
+        self._arrays["vectors.f16"][slot] = np.asarray(record["dense"], dtype=np.float16)
+        colbert_bytes = 0
+        if self.colbert:
+            path = self._colbert_path(key)
+            # Written next to the target and renamed, so a crash never leaves a torn file
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(record["colbert"], dtype=np.float16))
+            os.replace(path + ".tmp", path)
+            colbert_bytes = os.path.getsize(path)
+        if self.sparse_terms:
+            sparse = record.get("sparse") or {"indices": [], "values": []}
+            indices, values = sparse["indices"], sparse["values"]
+            if len(indices) > self.sparse_terms:
+                # Keep the strongest lexical weights
+                top = sorted(range(len(values)), key=lambda i: values[i], reverse=True)[:self.sparse_terms]
+                top.sort(key=lambda i: indices[i])
+                indices, values = [indices[i] for i in top], [values[i] for i in top]
+            nnz = len(indices)
+            self._arrays["sparse_idx.i32"][slot, :nnz] = indices
+            self._arrays["sparse_val.f16"][slot, :nnz] = values
+            self._arrays["sparse_nnz.i16"][slot] = nnz
+        return colbert_bytes
+
+    def get_many(self, texts: List[str]):
+        """Return a list aligned with `texts`: cached records, or None for misses."""
+        now = time.time()
+        results = []
+        dropped = []
+        keys = self._arrays["keys.i64"]
+        with self._lock:
+            for text in texts:
+                key = cache_key(self.model_name, text)
+                entry = self._entries.get(key)
+                record = None
+                if entry is not None and keys[entry[0]] == _fingerprint(key):
+                    record = self._read(entry[0], key)
+                if record is not None:
+                    entry[1] = now
+                    results.append(record)
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        # Slot was overwritten (e.g. crash before the index was saved),
+                        # or it is intact but its ColBERT file is gone
+                        del self._entries[key]
+                        if keys[entry[0]] == _fingerprint(key):
+                            keys[entry[0]] = 0
+                            self._free.append(entry[0])
+                        if self.colbert:
+                            self._drop_colbert(key, entry)
+                        dropped.append([key])
+                    results.append(None)
+                    self.misses += 1
+            # Hits only refresh last_used in memory: reads never write the index
+            self._log_append_locked(dropped)
+        return results
+
+    def put_many(self, texts: List[str], records: List[dict]):
+        now = time.time()
+        with self._lock:
+            stored = []
+            for text, record in zip(texts, records):
+                key = cache_key(self.model_name, text)
+                entry = self._entries.get(key)
+                slot = entry[0] if entry is not None else self._allocate_slot()
+                if entry is not None and self.colbert:
+                    self._colbert_bytes -= entry[2]
+                colbert_bytes = self._write(slot, record, key)
+                self._arrays["keys.i64"][slot] = _fingerprint(key)
+                self._entries[key] = [slot, now, colbert_bytes] if self.colbert else [slot, now]
+                self._colbert_bytes += colbert_bytes
+                stored.append([key] + self._entries[key])
+            self._log_append_locked(stored)
+            if self._colbert_bytes > self._colbert_max_bytes:
+                # Oldest first, down to 90% of the cap so the next batch does not evict again
+                oldest = sorted(self._entries.values(), key=lambda entry: entry[1])
+                excess, count = self._colbert_bytes - self._colbert_max_bytes * (1 - _EVICT_FRACTION), 0
+                while excess > 0 and count < len(oldest) - 1:
+                    excess -= oldest[count][2]
+                    count += 1
+                self._evict(count)
+            if self._log_lines > max(_COMPACT_MIN_LINES, len(self._entries)):
+                # Amortized: the log has to grow by a full index size before the next rewrite
+                self._write_snapshot_locked()
+
+    def lookup(self, texts: List[str]):
+        """
+        Cache lookup for a batch. Returns (records, misses) where misses maps each
+        missing cache key to the indices sharing it, so duplicates are embedded once.
+        """
+        records = self.get_many(texts)
+        misses = {}
+        for i, record in enumerate(records):
+            if record is None:
+                misses.setdefault(cache_key(self.model_name, texts[i]), []).append(i)
+        return records, misses
+
+    def fill(self, records, misses, miss_texts, new_records):
+        """Store freshly embedded misses and write them back into `records`."""
+        self.put_many(miss_texts, new_records)
+        for idx, record in zip(misses.values(), new_records):
+            for i in idx:
+                records[i] = record
+        return records
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        """Push vectors and the index log to disk (the snapshot is left to compaction)."""
+        if not self._dirty:
+            return
+        for array in self._arrays.values():
+            array.flush()
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._dirty = False
+
+    def _write_snapshot_locked(self):
+        """Rewrite `index.json` with every entry and empty the log."""
+        for array in self._arrays.values():
+            array.flush()
+        index = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "sparse_terms": self.sparse_terms,
+            "colbert": self.colbert,
+            "capacity": self._capacity,
+            "entries": self._entries,
+        }
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+        # Replaying a log already folded into the snapshot is harmless, so a crash here is safe
+        with open(self._log_path, "w", encoding="utf-8"):
+            pass
+        self._log_lines = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_mb": round((self._capacity * self._row_bytes + self._colbert_bytes) / (1024 * 1024), 1),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name: str = EMBEDDING_MODEL_NAME, dim: int = EMBEDDING_DIM) -> EmbeddingCache:
+    """
+    Process-wide cache instance per embedding model (with sparse weights in hybrid mode and
+    multi-vectors in colbert rerank mode).
+    """
+    sparse_terms = SPARSE_CACHE_MAX_TERMS if RETRIEVAL_MODE == "hybrid" else 0
+    with _caches_lock:
+        if model_name not in _caches:
+            cache = EmbeddingCache(model_name, dim, sparse_terms=sparse_terms, colbert=RERANK_MODE == "colbert")
+            atexit.register(cache.flush)
+            _caches[model_name] = cache
+        return _caches[model_name]
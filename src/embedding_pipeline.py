@@ -0,0 +1,258 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from src.config import (
+    EMBEDDING_WORKERS, EMBEDDING_THREADS_PER_WORKER, PIPELINE_QUEUE_SIZE, RETRIEVAL_MODE, UPSERT_PARALLEL,
+    RERANK_MODE, INGEST_NICENESS, INGEST_EMBED_SLICE, INGEST_YIELD_MAX_S
+)
+from src.embedding_cache import get_embedding_cache
+from src.vector_db import build_point, upsert_points_async
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+_DONE = object()
+# How often blocked stages re-check for a failure elsewhere in the pipeline
+_POLL_S = 0.1
+
+def _init_worker(num_threads):
+    """Runs once per worker process: lower its priority, pin torch threads and load the model resident."""
+    if INGEST_NICENESS and hasattr(os, "nice"):
+        try:
+            # Whole process, so torch/OpenMP threads are deprioritized too
+            os.nice(INGEST_NICENESS)
+        except OSError:
+            pass
+    import torch
+    torch.set_num_threads(num_threads)
+    from src.model_registry import get_embedding_model
+    get_embedding_model()
+
+def _embed_texts(texts):
+    from src.model_registry import get_embedding_model, wait_for_foreground
+    model = get_embedding_model()
+    records, embed_s = [], 0.0
+    step = max(1, INGEST_EMBED_SLICE)
+    for i in range(0, len(texts), step):
+        # In-process the model is shared with live queries: they go first (no-op in pool workers)
+        wait_for_foreground(INGEST_YIELD_MAX_S)
+        start_time = time.time()
+        # Dense (+ sparse lexical weights in hybrid mode, + ColBERT multi-vectors) from a single forward pass
+        records.extend(model.encode(texts[i:i + step], sparse=RETRIEVAL_MODE == "hybrid",
+                                    colbert=RERANK_MODE == "colbert"))
+        embed_s += time.time() - start_time
+    return records, embed_s
+
+class EmbeddingExecutor:
+    """
+    Embeds text batches either in-process (1 worker) or across a pool of worker
+    processes. Pool workers keep their model loaded between ingestions.
+    """
+
+    def __init__(self, workers: int = EMBEDDING_WORKERS, threads_per_worker: int = EMBEDDING_THREADS_PER_WORKER):
+        self.workers = max(1, workers)
+        if self.workers == 1:
+            # Shares the process-wide model; torch releases the GIL while encoding
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        else:
+            # spawn: forking a process that already holds torch state is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads_per_worker,)
+            )
+            logger.info(f"🧵 Embedding pool: {self.workers} workers x {threads_per_worker} torch threads")
+
+    def submit(self, texts):
+        """Returns a future resolving to (records, seconds spent embedding)."""
+        return self._pool.submit(_embed_texts, texts)
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_embedding_executor() -> EmbeddingExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = EmbeddingExecutor()
+        return _executor
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_s = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.busy_s += seconds
+
+    @property
+    def rate(self):
+        return self.items / self.busy_s if self.busy_s > 0 else 0.0
+
+    def to_dict(self):
+        return {"chunks": self.items, "busy_s": round(self.busy_s, 2), "chunks_per_s": round(self.rate, 1)}
+
+class _Pipeline:
+    def __init__(self, batch_size, on_batch):
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.executor = get_embedding_executor()
+        self.cache = get_embedding_cache()
+        # Enough in-flight batches to keep every worker busy
+        maxsize = max(PIPELINE_QUEUE_SIZE, self.executor.workers * 2)
+        self.embed_q = queue.Queue(maxsize=maxsize)
+        self.upsert_q = queue.Queue(maxsize=maxsize)
+        self.failed = threading.Event()
+        self.errors = []
+        self.stats = {
+            "chunking": StageStats("chunking"),
+            "embedding": StageStats("embedding"),
+            "upsert": StageStats("upsert"),
+        }
+        self.cache_hits = 0
+        self.batches = 0
+
+    def _put(self, q, item):
+        while not self.failed.is_set():
+            try:
+                q.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.failed.is_set():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e):
+        self.errors.append(e)
+        self.failed.set()
+
+    def _dispatch_loop(self):
+        """Embedding stage: cache lookup, then hand misses to the executor."""
+        try:
+            while True:
+                batch = self._get(self.embed_q)
+                if batch is _DONE:
+                    break
+                texts = [doc.page_content for doc in batch]
+                records, misses = self.cache.lookup(texts)
+                miss_texts = [texts[idx[0]] for idx in misses.values()]
+                future = self.executor.submit(miss_texts) if miss_texts else None
+                self.cache_hits += len(texts) - sum(len(idx) for idx in misses.values())
+                if not self._put(self.upsert_q, (batch, records, misses, miss_texts, future)):
+                    break
+            self._put(self.upsert_q, _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _finish_upsert(self, batch, embedded, future, busy_s):
+        """Wait for one in-flight upsert, then report the batch (always in batch order)."""
+        start_time = time.time()
+        future.result()
+        self.stats["upsert"].add(len(batch), busy_s + time.time() - start_time)
+
+        self.batches += 1
+        logger.info(f"   Batch {self.batches}: Upserted {len(batch)} chunks "
+                    f"({embedded} embedded, {len(batch) - embedded} cached)")
+        if self.on_batch:
+            self.on_batch(batch)
+
+    def _upsert_loop(self):
+        """Upsert stage: wait for vectors (in batch order) and write to Qdrant, several batches in flight."""
+        inflight = deque()
+        try:
+            while True:
+                item = self._get(self.upsert_q)
+                if item is _DONE:
+                    break
+                batch, records, misses, miss_texts, future = item
+                if future is not None:
+                    new_records, embed_s = future.result()
+                    self.cache.fill(records, misses, miss_texts, new_records)
+                    self.stats["embedding"].add(len(miss_texts), embed_s)
+
+                start_time = time.time()
+                upsert = upsert_points_async([build_point(doc, record) for doc, record in zip(batch, records)])
+                inflight.append((batch, len(miss_texts), upsert, time.time() - start_time))
+                while len(inflight) >= max(1, UPSERT_PARALLEL):
+                    self._finish_upsert(*inflight.popleft())
+            # Batches already sent still get reported (checkpoints), even after a failure elsewhere
+            while inflight:
+                self._finish_upsert(*inflight.popleft())
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, chunks):
+        threads = [
+            threading.Thread(target=self._dispatch_loop, name="pipeline-embed", daemon=True),
+            threading.Thread(target=self._upsert_loop, name="pipeline-upsert", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        wall_start = time.time()
+        batch = []
+        try:
+            # Chunking stage runs in the caller's thread, overlapping the stages above
+            chunk_iter = iter(chunks)
+            while not self.failed.is_set():
+                start_time = time.time()
+                doc = next(chunk_iter, _DONE)
+                self.stats["chunking"].add(0 if doc is _DONE else 1, time.time() - start_time)
+                if doc is _DONE:
+                    break
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    self._put(self.embed_q, batch)
+                    batch = []
+        except Exception as e:
+            # Upstream failure: still store the batches chunked so far (resumable runs)
+            self.errors.append(e)
+        if batch:
+            self._put(self.embed_q, batch)
+        self._put(self.embed_q, _DONE)
+
+        for t in threads:
+            t.join()
+        self.cache.flush()
+        if self.errors:
+            raise self.errors[0]
+
+        wall_s = time.time() - wall_start
+        total = self.stats["upsert"].items
+        result = {
+            "chunks": total,
+            "batches": self.batches,
+            "cache_hits": self.cache_hits,
+            "wall_s": round(wall_s, 2),
+            "chunks_per_s": round(total / wall_s, 1) if wall_s > 0 else 0.0,
+            "stages": {name: stage.to_dict() for name, stage in self.stats.items()},
+        }
+        stage_msg = ", ".join(f"{name} {stage.rate:.1f}/s" for name, stage in self.stats.items())
+        logger.info(f"⚡ Pipeline throughput: {result['chunks_per_s']} chunks/s overall ({stage_msg})")
+        return result
+
+def run_embedding_pipeline(chunks, batch_size: int, on_batch=None):
+    """
+    Embed and upsert `chunks` (any iterable of Documents with deterministic `id`s).
+    Chunking, embedding and upserts overlap through bounded queues; embedding only
+    runs for cache misses. `on_batch(docs)` is called after each batch is stored.
+    """
+    return _Pipeline(batch_size, on_batch).run(chunks)
@@ -0,0 +1,51 @@
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+def lexical_weights_to_sparse(weights: dict) -> dict:
+    """bge-m3 lexical weights {token_id: weight} -> {"indices": [...], "values": [...]}."""
+    items = sorted((int(token_id), float(weight)) for token_id, weight in weights.items() if weight > 0)
+    return {"indices": [i for i, _ in items], "values": [v for _, v in items]}
+
+class BGEM3Embeddings(Embeddings):
+    """
+    LangChain adapter over a shared BGEM3FlagModel.
+
+    embed_documents/embed_query return dense vectors like HuggingFaceBgeEmbeddings
+    (CLS pooling, normalized). encode() additionally returns the sparse lexical
+    weights and, on request, the ColBERT multi-vectors from the same forward pass.
+    """
+
+    def __init__(self, model, batch_size: int = 32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str], sparse: bool = True, colbert: bool = False) -> List[dict]:
+        """
+        One forward pass -> [{"dense": [...], "sparse": {"indices", "values"}, "colbert": array}, ...].
+        ColBERT multi-vectors are (tokens, dim) float16 arrays, a quarter of the size of float lists.
+        """
+        if not texts:
+            return []
+        output = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            return_dense=True,
+            return_sparse=sparse,
+            return_colbert_vecs=colbert,
+        )
+        records = [{"dense": vector.tolist()} for vector in output["dense_vecs"]]
+        if sparse:
+            for record, weights in zip(records, output["lexical_weights"]):
+                record["sparse"] = lexical_weights_to_sparse(weights)
+        if colbert:
+            for record, vectors in zip(records, output["colbert_vecs"]):
+                record["colbert"] = np.asarray(vectors, dtype=np.float16)
+        return records
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [record["dense"] for record in self.encode(texts, sparse=False)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
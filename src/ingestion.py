@@ -1,57 +1,69 @@
-
 import os
+import re
 import time
-from typing import List
+from typing import Iterable, Iterator
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
-from docling.document_converter import DocumentConverter
-from src.vector_db import get_embedding_model, initialize_vector_store
+from src.conversion import iter_markdown_slices, count_pages
+from src.markdown_cache import file_hash
+from src.vector_db import ensure_collection, delete_points, delete_source_points, bump_data_version
+from src.embedding_cache import get_embedding_cache
+from src.embedding_pipeline import run_embedding_pipeline
+from src.manifest import chunk_point_id, get_manifest, save_manifest, save_pending_chunks
 from src.utils import setup_logger
-from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, PAGES_PER_SLICE, GLOBAL_TENANT
 
 logger = setup_logger(__name__)
 
 # Batch size for adding documents to vector store
 BATCH_SIZE = 50
 
-def load_docling_markdown(file_path: str, original_filename: str = None) -> Document:
-    """Convert document to markdown using Docling"""
-    start_time = time.time()
-    logger.info(f"📄 Converting {file_path} using Docling...")
-    
-    converter = DocumentConverter()
-    result = converter.convert(file_path)
-    markdown_content = result.document.export_to_markdown()
-    
-    elapsed = time.time() - start_time
-    logger.info(f"✅ Docling conversion completed in {elapsed:.1f}s ({len(markdown_content):,} characters)")
-    
-    source_name = original_filename if original_filename else os.path.basename(file_path)
-    metadata = {"source": source_name}
-    return Document(page_content=markdown_content, metadata=metadata)
+HEADERS_TO_SPLIT_ON = [
+    ("#", "Header 1"),
+    ("##", "Header 2"),
+    ("###", "Header 3"),
+    ("####", "Header 4"),
+]
+HEADER_KEYS = [name for _, name in HEADERS_TO_SPLIT_ON]
+_HEADER_LINE_RE = re.compile(r"^(#{1,4})\s+(.*?)\s*#*\s*$")
 
-def process_document(file_path: str, user_id: str = "default", original_filename: str = None) -> List[Document]:
-    """Process document with optimized chunking pipeline"""
-    total_start = time.time()
-    
-    # 1. Load with Docling
-    doc = load_docling_markdown(file_path, original_filename)
-    
-    # 2. Structural Split using Markdown Headers
-    start_time = time.time()
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"), 
-        ("###", "Header 3"),
-        ("####", "Header 4"),
-    ]
-    header_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-    header_chunks = header_splitter.split_text(doc.page_content)
-    logger.info(f"📑 Header split: {len(header_chunks)} sections in {time.time() - start_time:.1f}s")
-    
-    # 3. OPTIMIZED: Use RecursiveCharacterTextSplitter instead of SemanticChunker
+def _update_header_stack(header_stack: dict, markdown: str) -> dict:
+    """Header path in effect at the end of `markdown`, starting from `header_stack`."""
+    header_stack = dict(header_stack)
+    in_code_block = False
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            in_code_block = not in_code_block
+            continue
+        if in_code_block:
+            continue
+        match = _HEADER_LINE_RE.match(stripped)
+        if match:
+            level = len(match.group(1))
+            for key in HEADER_KEYS[level - 1:]:
+                header_stack.pop(key, None)
+            header_stack[HEADER_KEYS[level - 1]] = match.group(2)
+    return header_stack
+
+def _header_prefix(header_stack: dict) -> str:
+    """Markdown header lines that re-open `header_stack` at the top of the next slice."""
+    lines = []
+    for marker, key in HEADERS_TO_SPLIT_ON:
+        if key in header_stack:
+            lines.append(f"{marker} {header_stack[key]}")
+    return "\n".join(lines) + "\n\n" if lines else ""
+
+def iter_chunks(markdown_slices: Iterable[str], source_name: str, user_id: str = GLOBAL_TENANT) -> Iterator[Document]:
+    """
+    Header-aware chunking over a stream of markdown slices.
+    The header path open at the end of one slice is replayed at the top of the next,
+    so sections split across page ranges keep the right header metadata.
+    """
+    header_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON)
+
+    # OPTIMIZED: Use RecursiveCharacterTextSplitter instead of SemanticChunker
     # This is 10-20x faster while still maintaining good quality
-    start_time = time.time()
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
@@ -59,88 +71,180 @@ def process_document(file_path: str, user_id: str = "default", original_filename
         separators=["\n\n", "\n", ". ", "! ", "? ", ", ", " ", ""],
         is_separator_regex=False,
     )
-    
-    final_chunks = []
+
+    seen_ids = set()
+    header_stack = {}
+    i = 0
+
+    for markdown in markdown_slices:
+        # Structural Split using Markdown Headers
+        header_chunks = header_splitter.split_text(_header_prefix(header_stack) + markdown)
+        header_stack = _update_header_stack(header_stack, markdown)
+
+        for h_chunk in header_chunks:
+            # Build Context from Metadata (Header Path)
+            header_context_list = []
+            for key in HEADER_KEYS:
+                if key in h_chunk.metadata:
+                    header_context_list.append(h_chunk.metadata[key])
+
+            header_context = " > ".join(header_context_list) if header_context_list else "General"
+
+            # Fast text splitting
+            sub_chunks = text_splitter.split_text(h_chunk.page_content)
+
+            for j, sub_content in enumerate(sub_chunks):
+                # Skip very short chunks
+                if len(sub_content.strip()) < 50:
+                    continue
+
+                # Deterministic ID: unchanged chunks keep their point across re-ingestions
+                point_id = chunk_point_id(source_name, header_context, sub_content)
+                if point_id in seen_ids:
+                    continue
+                seen_ids.add(point_id)
+
+                # Contextual Enrichment
+                enriched_content = f"[Context: {source_name} > {header_context}]\n\n{sub_content}"
+
+                new_metadata = h_chunk.metadata.copy()
+                new_metadata["source"] = source_name
+                new_metadata["chunk_id"] = f"{i}_{j}"
+                new_metadata["header_path"] = header_context
+                new_metadata["user_id"] = user_id
+
+                yield Document(
+                    id=point_id,
+                    page_content=enriched_content,
+                    metadata=new_metadata
+                )
+
+            i += 1
+            # Progress logging every 100 sections
+            if i % 100 == 0:
+                logger.info(f"   Processed {i} sections...")
+
+def _count_slices(file_path: str) -> int:
+    num_pages = count_pages(file_path)
+    if num_pages is None or num_pages <= PAGES_PER_SLICE:
+        return 1
+    return (num_pages + PAGES_PER_SLICE - 1) // PAGES_PER_SLICE
+
+def _report_progress(slices, total, on_progress):
+    for done, markdown in enumerate(slices, start=1):
+        yield markdown
+        on_progress(done, total)
+
+def iter_document_chunks(file_path: str, user_id: str = GLOBAL_TENANT, original_filename: str = None,
+                         on_progress=None) -> Iterator[Document]:
+    """
+    Stream chunks of a document while Docling is still converting later pages.
+    on_progress(done, total) is called after each page range is chunked.
+    """
     source_name = original_filename if original_filename else os.path.basename(file_path)
-    
-    for i, h_chunk in enumerate(header_chunks):
-        # Build Context from Metadata (Header Path)
-        header_context_list = []
-        for key in ["Header 1", "Header 2", "Header 3", "Header 4"]:
-            if key in h_chunk.metadata:
-                header_context_list.append(h_chunk.metadata[key])
-        
-        header_context = " > ".join(header_context_list) if header_context_list else "General"
-        
-        # Fast text splitting
-        sub_chunks = text_splitter.split_text(h_chunk.page_content)
-        
-        for j, sub_content in enumerate(sub_chunks):
-            # Skip very short chunks
-            if len(sub_content.strip()) < 50:
-                continue
-                
-            # Contextual Enrichment
-            enriched_content = f"[Context: {source_name} > {header_context}]\n\n{sub_content}"
-            
-            new_metadata = h_chunk.metadata.copy()
-            new_metadata["source"] = source_name
-            new_metadata["chunk_id"] = f"{i}_{j}"
-            new_metadata["user_id"] = user_id
-            
-            new_doc = Document(
-                page_content=enriched_content,
-                metadata=new_metadata
-            )
-            final_chunks.append(new_doc)
-        
-        # Progress logging every 100 sections
-        if (i + 1) % 100 == 0:
-            logger.info(f"   Processed {i + 1}/{len(header_chunks)} sections...")
-    
-    elapsed = time.time() - start_time
-    logger.info(f"✂️ Text chunking: {len(final_chunks)} chunks in {elapsed:.1f}s")
-    
-    total_elapsed = time.time() - total_start
-    logger.info(f"📊 Document processing completed in {total_elapsed:.1f}s total")
-    
-    return final_chunks
+    logger.info(f"📄 Converting {file_path} using Docling...")
+    slices = iter_markdown_slices(file_path)
+    if on_progress:
+        slices = _report_progress(slices, _count_slices(file_path), on_progress)
+    return iter_chunks(slices, source_name, user_id)
+
+def ingest_file(file_path: str, user_id: str = GLOBAL_TENANT, original_filename: str = None,
+                skip_ids=None, on_batch=None, on_progress=None):
+    """
+    Ingest file incrementally while it streams: chunks are embedded and upserted as
+    page ranges finish converting. Only new chunks are embedded, removed chunks are deleted.
+    Raises ValueError if a document with the same name belongs to another user.
 
-def ingest_file(file_path: str, user_id: str = "default", original_filename: str = None):
-    """Ingest file with batch processing for better performance"""
+    skip_ids: point IDs already upserted by an interrupted run of this file (resume).
+    on_batch: callback(docs) after each batch is stored, e.g. for checkpointing.
+    on_progress: callback(done, total) in converted page ranges.
+    """
     logger.info(f"🚀 Starting ingestion for: {file_path} (User: {user_id})")
     total_start = time.time()
-    
-    # Process document
-    chunks = process_document(file_path, user_id, original_filename)
-    
-    if not chunks:
-        logger.warning("⚠️ No chunks to ingest.")
-        return
-    
+    source_name = original_filename if original_filename else os.path.basename(file_path)
+
     # Initialize vector store
     start_time = time.time()
-    vector_store = initialize_vector_store()
+    client = ensure_collection()
     logger.info(f"🗄️ Vector store initialized in {time.time() - start_time:.1f}s")
-    
-    # Batch insert for better performance
+
+    # Diff against the stored manifest of this source
+    manifest = get_manifest(client, source_name)
+    if manifest and manifest.get("user_id") != user_id:
+        # Manifests and point IDs are keyed by file name: going on would take over (and then
+        # delete) the other tenant's chunks. The owner is not echoed back to the uploader.
+        # (Legacy "default" owners were normalized by ensure_collection above.)
+        logger.error(f"❌ {source_name} belongs to {manifest.get('user_id')}, refusing ingestion for {user_id}")
+        raise ValueError(f"A document named '{source_name}' already belongs to another user; "
+                         f"rename the file or ask an admin to delete the existing one")
+    skip_ids = set(skip_ids or ())
+    # Never ingested, or ingested before manifests existed (random IDs): the old points are
+    # deleted once the new chunks are stored, so the document stays searchable meanwhile
+    untracked = manifest is None or manifest.get("untracked", False)
+    stored_ids = set(manifest.get("chunk_ids", [])) if manifest else set()
+    # Points of an interrupted run (maybe stored, never saved in chunk_ids): deleted unless still current
+    pending_ids = set(manifest.get("pending_ids", [])) if manifest else set()
+
+    # Unchanged chunks are skipped
+    unchanged_ids = stored_ids | skip_ids
+    new_ids = set()
+
+    def record_pending(docs):
+        # Recorded before the batch can reach Qdrant
+        if docs:
+            pending_ids.update(doc.id for doc in docs)
+            save_pending_chunks(client, source_name, user_id, pending_ids, untracked)
+        return docs
+
+    def chunks_to_upsert():
+        batch = []
+        for doc in iter_document_chunks(file_path, user_id, original_filename, on_progress):
+            new_ids.add(doc.id)
+            if doc.id not in unchanged_ids:
+                batch.append(doc)
+            if len(batch) == BATCH_SIZE:
+                yield from record_pending(batch)
+                batch = []
+        yield from record_pending(batch)
+
+    def batch_stored(batch):
+        if not first_batch_at:
+            first_batch_at.append(time.time())
+            logger.info(f"🔎 First chunks searchable after {first_batch_at[0] - total_start:.1f}s")
+        if on_batch:
+            on_batch(batch)
+
+    # Convert, chunk, embed (cache misses only) and upsert as an overlapped stream
     start_time = time.time()
-    total_batches = (len(chunks) + BATCH_SIZE - 1) // BATCH_SIZE
-    
-    for i in range(0, len(chunks), BATCH_SIZE):
-        batch = chunks[i:i + BATCH_SIZE]
-        batch_num = i // BATCH_SIZE + 1
-        
-        vector_store.add_documents(batch)
-        logger.info(f"   Batch {batch_num}/{total_batches}: Added {len(batch)} chunks")
-    
+    first_batch_at = []
+    run_embedding_pipeline(chunks_to_upsert(), batch_size=BATCH_SIZE, on_batch=batch_stored)
+
+    if not new_ids:
+        logger.warning("⚠️ No chunks to ingest.")
+        return
+
+    to_delete = (stored_ids | pending_ids) - new_ids
+    delete_points(to_delete)
+    if untracked:
+        # Legacy points of another tenant sharing the file name are left alone
+        delete_source_points(source_name, keep_ids=new_ids, user_id=user_id)
+    save_manifest(client, source_name, user_id, new_ids,
+                  size_bytes=os.path.getsize(file_path), content_hash=file_hash(file_path))
+    bump_data_version()
+    logger.info(f"🔁 Diff: {len(new_ids - unchanged_ids)} new/changed, {len(to_delete)} removed, "
+                f"{len(new_ids & unchanged_ids)} unchanged chunks")
+
     elapsed = time.time() - start_time
     total_elapsed = time.time() - total_start
-    
-    logger.info(f"💾 Vector store insertion: {elapsed:.1f}s")
-    logger.info(f"✅ INGESTION COMPLETE: {len(chunks)} chunks in {total_elapsed:.1f}s total")
-    
-    return len(chunks)
+
+    cache_stats = get_embedding_cache().stats()
+    logger.info(f"🗃️ Embedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"(hit rate {cache_stats['hit_rate']:.0%}, {cache_stats['entries']:,} vectors stored)")
+    logger.info(f"💾 Convert + embed + insert: {elapsed:.1f}s")
+    logger.info(f"✅ INGESTION COMPLETE: {len(new_ids)} chunks in {total_elapsed:.1f}s total")
+
+    return len(new_ids)
 if __name__ == "__main__":
-    # Test ingestion
-    pass
+    # Headless bulk ingestion: python -m src.ingestion <directory>
+    from src.bulk_ingest import main
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+import uuid
+from src.config import INGEST_JOBS_PATH, MAX_CONCURRENT_INGESTS, INGEST_NICENESS
+from src.ingestion import ingest_file
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs kept in the table (older ones are dropped)
+_MAX_FINISHED_JOBS = 50
+
+def _lower_thread_priority():
+    """Best effort: deprioritize the calling thread (and threads/processes it starts)."""
+    if not INGEST_NICENESS or not hasattr(os, "setpriority"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), INGEST_NICENESS)
+    except (OSError, AttributeError):
+        pass
+
+def _remove_upload(job):
+    """Delete the temp upload of a job that owns it."""
+    if job.get("delete_after") and os.path.exists(job["file_path"]):
+        try:
+            os.remove(job["file_path"])
+        except OSError:
+            pass
+
+class IngestionJobQueue:
+    """
+    Persistent background ingestion worker shared by every Streamlit session.
+
+    Jobs live in a JSON job table (queued/running/done/failed, progress, ETA) so the
+    admin UI can poll it. At most MAX_CONCURRENT_INGESTS documents ingest at once, in
+    low-priority threads, so chat stays responsive. Jobs interrupted by a restart are
+    re-queued; incremental ingestion makes the re-run cheap. A failed job keeps its upload
+    until it is retried successfully or dismissed.
+    """
+
+    def __init__(self, path: str = INGEST_JOBS_PATH, workers: int = MAX_CONCURRENT_INGESTS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._jobs = {}
+        self._load()
+        self._threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                jobs = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not read job table {self.path}: {e}")
+            return
+        for job in jobs:
+            if job["status"] in (QUEUED, RUNNING):
+                if os.path.exists(job["file_path"]):
+                    job.update(status=QUEUED, progress=0.0, eta_s=None, started_at=None)
+                    logger.info(f"🔁 Re-queued interrupted ingestion job {job['id']} ({job['filename']})")
+                else:
+                    job.update(status=FAILED, error="Upload was lost before ingestion finished",
+                               finished_at=time.time())
+            self._jobs[job["id"]] = job
+
+    def _save_locked(self):
+        finished = sorted((j for j in self._jobs.values() if j["status"] in (DONE, FAILED)),
+                          key=lambda j: j["finished_at"] or 0)
+        for job in finished[:-_MAX_FINISHED_JOBS]:
+            del self._jobs[job["id"]]
+            _remove_upload(job)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self._jobs.values()), f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            self._save_locked()
+
+    def submit(self, file_path: str, user_id: str, filename: str, delete_after: bool = True) -> str:
+        """Queue a document for ingestion and return its job ID immediately."""
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "file_path": file_path,
+            "filename": filename,
+            "user_id": user_id,
+            "delete_after": delete_after,
+            "status": QUEUED,
+            "progress": 0.0,
+            "eta_s": None,
+            "chunks": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._wakeup:
+            self._jobs[job["id"]] = job
+            self._save_locked()
+            self._wakeup.notify()
+        logger.info(f"📥 Queued ingestion job {job['id']} for {filename} (User: {user_id})")
+        return job["id"]
+
+    def retry(self, job_id: str) -> bool:
+        """Re-queue a failed job whose upload is still there."""
+        with self._wakeup:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != FAILED or not os.path.exists(job["file_path"]):
+                return False
+            job.update(status=QUEUED, progress=0.0, eta_s=None, error=None, started_at=None, finished_at=None)
+            self._save_locked()
+            self._wakeup.notify()
+        logger.info(f"🔁 Retrying ingestion job {job_id} ({job['filename']})")
+        return True
+
+    def dismiss(self, job_id: str) -> bool:
+        """Drop a finished job from the table (and its kept upload)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in (DONE, FAILED):
+                return False
+            del self._jobs[job_id]
+            self._save_locked()
+        _remove_upload(job)
+        return True
+
+    def list_jobs(self, limit: int = 20):
+        """Most recent jobs first (copies, safe to read from the UI thread)."""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j["created_at"], reverse=True)
+            return [dict(job) for job in jobs[:limit]]
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING))
+
+    def _next_job_locked(self):
+        queued = [job for job in self._jobs.values() if job["status"] == QUEUED]
+        return min(queued, key=lambda j: j["created_at"]) if queued else None
+
+    def _worker_loop(self):
+        _lower_thread_priority()
+        while True:
+            with self._wakeup:
+                job = self._next_job_locked()
+                while job is None:
+                    self._wakeup.wait()
+                    job = self._next_job_locked()
+                job.update(status=RUNNING, started_at=time.time())
+                self._save_locked()
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["id"]
+        started_at = job["started_at"]
+
+        def on_progress(done, total):
+            fraction = done / total if total else 0.0
+            elapsed = time.time() - started_at
+            eta = elapsed / fraction - elapsed if fraction > 0 else None
+            self._update(job_id, progress=round(fraction, 3), eta_s=round(eta, 1) if eta is not None else None)
+
+        try:
+            chunks = ingest_file(job["file_path"], user_id=job["user_id"],
+                                 original_filename=job["filename"], on_progress=on_progress)
+        except Exception as e:
+            # The upload is kept so the job can be retried
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            logger.error(f"❌ Ingestion job {job_id} failed ({job['filename']}): {e}")
+            return
+        self._update(job_id, status=DONE, progress=1.0, eta_s=0, chunks=chunks or 0,
+                     finished_at=time.time())
+        _remove_upload(job)
+        logger.info(f"✅ Ingestion job {job_id} done ({job['filename']})")
+
+_queue_instance = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> IngestionJobQueue:
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            _queue_instance = IngestionJobQueue()
+        return _queue_instance
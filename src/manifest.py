@@ -0,0 +1,109 @@
+import hashlib
+import time
+import uuid
+from qdrant_client.http import models
+from src.config import MANIFEST_COLLECTION_NAME, GLOBAL_TENANT, LEGACY_TENANT
+from src.utils import normalize_text
+
+# Fixed namespace so the same chunk always maps to the same point ID
+_ID_NAMESPACE = uuid.UUID("5b0f8a1e-4a4e-4d5c-9f3e-2f6a7c1d9b21")
+
+def chunk_point_id(source: str, header_path: str, content: str) -> str:
+    """Deterministic point ID from (source, header path, chunk content hash)."""
+    content_hash = hashlib.sha256(normalize_text(content).encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(_ID_NAMESPACE, f"{source}\x1f{header_path}\x1f{content_hash}"))
+
+def _manifest_point_id(source: str) -> str:
+    return str(uuid.uuid5(_ID_NAMESPACE, f"manifest\x1f{source}"))
+
+def ensure_manifest_collection(client):
+    try:
+        client.get_collection(MANIFEST_COLLECTION_NAME)
+    except Exception:
+        # Payload-only store: a 1-dim placeholder vector keeps every Qdrant mode happy
+        client.create_collection(
+            collection_name=MANIFEST_COLLECTION_NAME,
+            vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT)
+        )
+
+def get_manifest(client, source: str):
+    """Return the stored manifest for `source`, or None if it was never ingested."""
+    ensure_manifest_collection(client)
+    points = client.retrieve(
+        collection_name=MANIFEST_COLLECTION_NAME,
+        ids=[_manifest_point_id(source)],
+        with_payload=True,
+        with_vectors=False
+    )
+    return points[0].payload if points else None
+
+def save_manifest(client, source: str, user_id: str, chunk_ids, size_bytes=None, content_hash=None,
+                  pending_ids=(), untracked: bool = False):
+    """
+    Store the manifest of `source`; it doubles as the document catalog entry.
+    pending_ids: points an unfinished ingestion may have stored (see save_pending_chunks).
+    untracked: the source may still hold points listed nowhere (ingested before manifests).
+    """
+    ensure_manifest_collection(client)
+    payload = {
+        "source": source,
+        "user_id": user_id,
+        "chunk_ids": sorted(chunk_ids),
+        "chunk_count": len(chunk_ids),
+        "size_bytes": size_bytes,
+        "content_hash": content_hash,
+        "pending_ids": sorted(pending_ids),
+        "untracked": untracked,
+        "updated_at": time.time(),
+    }
+    client.upsert(
+        collection_name=MANIFEST_COLLECTION_NAME,
+        points=[models.PointStruct(id=_manifest_point_id(source), vector=[1.0], payload=payload)]
+    )
+
+def save_pending_chunks(client, source: str, user_id: str, pending_ids, untracked: bool = False):
+    """
+    Record the chunk IDs an ingestion is about to upsert, before it does, so a run that dies
+    before save_manifest leaves no point the next diff of `source` cannot see.
+    A source without a manifest gets an empty one (no chunks yet).
+    """
+    ensure_manifest_collection(client)
+    point_id = _manifest_point_id(source)
+    if client.retrieve(collection_name=MANIFEST_COLLECTION_NAME, ids=[point_id], with_payload=False, with_vectors=False):
+        client.set_payload(collection_name=MANIFEST_COLLECTION_NAME, payload={"pending_ids": sorted(pending_ids)},
+                           points=[point_id])
+    else:
+        save_manifest(client, source, user_id, [], pending_ids=pending_ids, untracked=untracked)
+
+def list_manifests(client, offset=None, limit: int = 50):
+    """
+    One page of the document catalog, without the chunk ID lists.
+    Returns (entries, next_offset); next_offset is None on the last page.
+    """
+    ensure_manifest_collection(client)
+    points, next_offset = client.scroll(
+        collection_name=MANIFEST_COLLECTION_NAME,
+        offset=offset,
+        limit=limit,
+        with_payload=models.PayloadSelectorExclude(exclude=["chunk_ids", "pending_ids"]),
+        with_vectors=False
+    )
+    return [point.payload for point in points], next_offset
+
+def delete_manifest(client, source: str):
+    ensure_manifest_collection(client)
+    client.delete(
+        collection_name=MANIFEST_COLLECTION_NAME,
+        points_selector=models.PointIdsList(points=[_manifest_point_id(source)])
+    )
+
+def normalize_manifest_tenants(client):
+    """Rewrite legacy "default" owners to the global tenant (matches the chunk migration)."""
+    ensure_manifest_collection(client)
+    client.set_payload(
+        collection_name=MANIFEST_COLLECTION_NAME,
+        payload={"user_id": GLOBAL_TENANT},
+        points=models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="user_id", match=models.MatchValue(value=LEGACY_TENANT))
+        ]))
+    )
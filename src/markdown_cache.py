@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from src.config import MARKDOWN_CACHE_DIR, MARKDOWN_CACHE_MAX_MB
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+_SUFFIX = ".jsonl.gz"
+_evict_lock = threading.Lock()
+
+def file_hash(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _docling_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("docling")
+    except Exception:
+        return "unknown"
+
+def markdown_cache_key(file_path: str, pages_per_slice: int) -> str:
+    """Content hash of the file plus everything that changes Docling's output."""
+    return hashlib.sha256(
+        f"{file_hash(file_path)}\0{pages_per_slice}\0{_docling_version()}".encode("utf-8")
+    ).hexdigest()
+
+def _path(key: str) -> str:
+    return os.path.join(MARKDOWN_CACHE_DIR, key + _SUFFIX)
+
+def iter_cached_slices(key: str):
+    """Yield cached markdown slices for `key`, or return None on a miss."""
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    # Touch for LRU eviction
+    os.utime(path)
+    return _read_slices(path)
+
+def _read_slices(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def write_through(key: str, slices):
+    """
+    Pass `slices` through while compressing them to the cache. The entry only
+    becomes visible once the whole document has been converted.
+    """
+    os.makedirs(MARKDOWN_CACHE_DIR, exist_ok=True)
+    path = _path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    completed = False
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for markdown in slices:
+                f.write(json.dumps(markdown) + "\n")
+                yield markdown
+        os.replace(tmp_path, path)
+        completed = True
+        logger.info(f"🗜️ Cached converted markdown ({os.path.getsize(path) / 1024:,.0f} KB compressed)")
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict(MARKDOWN_CACHE_MAX_MB)
+
+def evict(max_mb: int = MARKDOWN_CACHE_MAX_MB):
+    """Remove least recently used entries until the cache fits in `max_mb`."""
+    with _evict_lock:
+        try:
+            entries = []
+            for name in os.listdir(MARKDOWN_CACHE_DIR):
+                if name.endswith(_SUFFIX):
+                    path = os.path.join(MARKDOWN_CACHE_DIR, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            return
+        total = sum(size for _, size, _ in entries)
+        limit = max_mb * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            os.remove(path)
+            total -= size
+            logger.info(f"🧹 Evicted cached markdown {os.path.basename(path)}")
@@ -1,5 +1,9 @@
 
 from mem0 import Memory
+from src.config import EMBEDDING_DIM, QDRANT_URL, QDRANT_API_KEY, MEMORY_WRITE_ASYNC, MEM0_STORAGE_PATH
+from src.memory_context import get_memory_context_builder
+from src.memory_writer import get_memory_writer, interaction_messages
+from src.model_registry import get_embedding_model
 
 # Mem0 requires configuration, possibly OpenAI key if using their default embedding, 
 # or can use local qdrant/embedding.
@@ -11,20 +15,30 @@ class UserMemory:
         if memory_client:
             self.memory = memory_client
         else:
+            if QDRANT_URL:
+                # Same Qdrant server as the documents: no local lock, shared across app replicas
+                vector_store_config = {
+                    "url": QDRANT_URL,
+                    "api_key": QDRANT_API_KEY,
+                    "embedding_model_dims": EMBEDDING_DIM,
+                }
+            else:
+                vector_store_config = {
+                    "path": MEM0_STORAGE_PATH,
+                    "on_disk": True,
+                    "embedding_model_dims": EMBEDDING_DIM,
+                }
             config = {
                 "vector_store": {
                     "provider": "qdrant",
-                    "config": {
-                        "path": "./mem0_storage_v4",
-                        "on_disk": True,
-                        "embedding_model_dims": 1024,
-                    }
+                    "config": vector_store_config
                 },
+                # Reuse the process-wide bge-m3 instead of loading a second copy
                 "embedder": {
-                    "provider": "huggingface",
+                    "provider": "langchain",
                     "config": {
-                        "model": "BAAI/bge-m3",
-                        "model_kwargs": {"device": "cpu"}
+                        "model": get_embedding_model(),
+                        "embedding_dims": EMBEDDING_DIM,
                     }
                 },
                 "llm": {
@@ -41,56 +55,35 @@ class UserMemory:
             
         self.user_id = user_id
 
-    def add_interaction(self, user_input, system_response):
-        # We can store the interaction
-        self.memory.add(f"User: {user_input}\nSystem: {system_response}", user_id=self.user_id)
+    def add_interaction(self, user_input, system_response, wait=False):
+        """
+        Store an interaction. By default it is journaled and written in the background
+        (batched with the user's next turns); wait=True writes it before returning.
+        """
+        if MEMORY_WRITE_ASYNC and not wait:
+            return get_memory_writer(self.memory).submit(self.user_id, user_input, system_response)
+        entry = {"user": user_input, "assistant": system_response}
+        self.memory.add(interaction_messages([entry]), user_id=self.user_id)
+        get_memory_context_builder().invalidate(self.user_id)
+
+    def pending_writes(self):
+        """Interactions queued for this user but not in mem0 yet."""
+        if not MEMORY_WRITE_ASYNC:
+            return 0
+        return get_memory_writer(self.memory).pending_count(self.user_id)
 
     def get_context(self, query=None):
         """
-        Retrieves context. 
-        For a reliable 'User Profile' experience, we fetch ALL stored memories for this user
-        and inject them. Similarity search often misses facts like 'Name' if the query doesn't match specific keywords.
+        Memory block for the prompt: pinned profile facts (name, role, ...) plus the
+        memories most relevant to `query`, within MEMORY_CONTEXT_MAX_TOKENS.
+        Similarity search alone often misses facts like 'Name', hence the pinned part.
         """
         try:
-            # Fetch all memories (facts/profile) for this user
-            results = self.memory.get_all(user_id=self.user_id)
+            return get_memory_context_builder().build(self.memory, self.user_id, query)
         except Exception as e:
             print(f"Error fetching context: {e}")
             return ""
 
-        if isinstance(results, dict):
-            related_memories = results.get("results", [])
-        elif isinstance(results, list):
-            related_memories = results
-        else:
-            related_memories = []
-            
-        if not related_memories:
-            return ""
-        
-        valid_texts = []
-        for m in related_memories:
-            # Handle standard mem0 dictionary structure
-            if isinstance(m, dict):
-                # Typically mem0 returns {'memory': 'Fact string', ...} or {'text': ...}
-                text = m.get('memory') or m.get('text')
-                if text:
-                    valid_texts.append(text)
-            elif isinstance(m, str):
-                valid_texts.append(m)
-            # Handle Qdrant objects just in case
-            elif hasattr(m, 'payload'):
-                valid_texts.append(m.payload.get('memory') or m.payload.get('text', ''))
-        
-        if not valid_texts:
-            return ""
-
-        # Deduplicate and Format
-        valid_texts = list(set(valid_texts))
-        context_parts = [f"- {t}" for t in valid_texts if t]
-        
-        return "Thông tin về người dùng (User Memory / Profile):\n" + "\n".join(context_parts)
-
     def get_all_memories(self):
         """Retrieve all memories for the current user to display in UI"""
         try:
@@ -0,0 +1,250 @@
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from src.config import (
+    QDRANT_URL, MEM0_STORAGE_PATH, MEMORY_CONTEXT_FETCH_LIMIT, MEMORY_CONSOLIDATION_SIMILARITY,
+    MEMORY_FRAGMENT_TTL_DAYS, MEMORY_CONSOLIDATION_INTERVAL_H, MEMORY_CONSOLIDATION_APPLY, MEMORY_WRITE_ASYNC
+)
+from src.memory_context import get_memory_context_builder, memory_items, is_pinned
+from src.memory_writer import get_memory_writer
+from src.model_registry import get_embedding_model, count_tokens
+from src.vector_db import get_shared_version, bump_shared_version
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Raw dialogue stored verbatim (legacy add_interaction format or a failed fact extraction)
+_FRAGMENT_RE = re.compile(r"^\s*(user|system|assistant)\s*:|\n\s*(system|assistant)\s*:", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+")
+# Shared version holding the start time of the last scheduled run (server mode)
+_LEASE_KEY = "memory-consolidation"
+
+def _timestamp(item):
+    """Last update (or creation) time of a memory as a UTC datetime, None if unknown."""
+    value = item.get("updated_at") or item.get("created_at")
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def is_stale_fragment(item, now, ttl_days: float = MEMORY_FRAGMENT_TTL_DAYS) -> bool:
+    if not _FRAGMENT_RE.search(item["text"]) or is_pinned(item["text"]):
+        return False
+    ts = _timestamp(item)
+    return ts is not None and (now - ts).total_seconds() > ttl_days * 86400
+
+def _words(text: str):
+    return set(_WORD_RE.findall(text.casefold()))
+
+def find_duplicates(items, vectors, threshold: float = MEMORY_CONSOLIDATION_SIMILARITY):
+    """
+    Near-exact duplicates only. A memory is redundant when a kept memory has cosine >= threshold
+    with it AND contains every word of it, so a fact carrying any extra detail (another
+    number, a negation, a new place) is never dropped. Memories with the most words are
+    kept first, the newest on ties. Returns [[index of kept memory, redundant index, ...], ...].
+    """
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    words = [_words(item["text"]) for item in items]
+    order = sorted(range(len(items)), key=lambda i: (len(words[i]), _timestamp(items[i]) or oldest), reverse=True)
+    clusters = []
+    for i in order:
+        for cluster in clusters:
+            kept = cluster[0]
+            # bge-m3 vectors are normalized: dot product = cosine
+            if words[i] <= words[kept] and float(vectors[kept] @ vectors[i]) >= threshold:
+                cluster.append(i)
+                break
+        else:
+            clusters.append([i])
+    return clusters
+
+def _footprint(items):
+    return {"memories": len(items), "tokens": sum(count_tokens(item["text"]) for item in items)}
+
+def _dir_size_mb(path):
+    if QDRANT_URL or not os.path.isdir(path):
+        return None
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return round(total / (1024 * 1024), 2)
+
+def list_memory_users(memory):
+    """Every user_id present in mem0's Qdrant collection."""
+    store = memory.vector_store
+    users, offset = set(), None
+    while True:
+        points, offset = store.client.scroll(collection_name=store.collection_name, limit=1000, offset=offset,
+                                             with_payload=["user_id"], with_vectors=False)
+        users.update(point.payload["user_id"] for point in points if point.payload.get("user_id"))
+        if offset is None:
+            return sorted(users)
+
+def consolidate_user(memory, user_id, threshold: float = MEMORY_CONSOLIDATION_SIMILARITY,
+                     ttl_days: float = MEMORY_FRAGMENT_TTL_DAYS, dry_run: bool = True):
+    """
+    Delete near-exact duplicate memories of one user (see find_duplicates) and expire stale
+    conversational fragments. Returns the per-user report (before/after footprint).
+    """
+    try:
+        results = memory.get_all(user_id=user_id, limit=MEMORY_CONTEXT_FETCH_LIMIT)
+    except TypeError:
+        # mem0 versions without a `limit` argument
+        results = memory.get_all(user_id=user_id)
+    items = [item for item in memory_items(results) if item["id"]]
+    report = {"user_id": user_id, "before": _footprint(items), "merged": 0, "expired": 0}
+
+    now = datetime.now(timezone.utc)
+    expired = [item for item in items if is_stale_fragment(item, now, ttl_days)]
+    expired_ids = {item["id"] for item in expired}
+    kept = [item for item in items if item["id"] not in expired_ids]
+
+    redundant = []
+    if len(kept) > 1:
+        vectors = np.asarray(get_embedding_model().embed_documents([item["text"] for item in kept]), dtype=np.float32)
+        for cluster in find_duplicates(kept, vectors, threshold):
+            redundant.extend(kept[i] for i in cluster[1:])
+    redundant_ids = {item["id"] for item in redundant}
+
+    if not dry_run:
+        for item in expired + redundant:
+            memory.delete(item["id"])
+        if expired or redundant:
+            get_memory_context_builder().invalidate(user_id)
+
+    report["merged"] = len(redundant)
+    report["expired"] = len(expired)
+    report["after"] = _footprint([item for item in kept if item["id"] not in redundant_ids])
+    return report
+
+def run_consolidation(memory, user_ids=None, threshold: float = MEMORY_CONSOLIDATION_SIMILARITY,
+                      ttl_days: float = MEMORY_FRAGMENT_TTL_DAYS, dry_run: bool = True, exclusive=None):
+    """
+    Consolidate `user_ids` (default: every user in the store) and summarize the result.
+    exclusive: callable(fn, *args) -> Future running `fn` on the memory writer thread; each user is
+    a separate task, so memory writes go through between users.
+    """
+    start_time = time.time()
+    size_before = _dir_size_mb(MEM0_STORAGE_PATH)
+    if user_ids is None:
+        user_ids = list_memory_users(memory)
+
+    users, failed = [], []
+    for user_id in user_ids:
+        try:
+            if exclusive is None:
+                report = consolidate_user(memory, user_id, threshold, ttl_days, dry_run)
+            else:
+                report = exclusive(consolidate_user, memory, user_id, threshold, ttl_days, dry_run).result()
+        except Exception as e:
+            failed.append({"user_id": user_id, "error": str(e)})
+            logger.error(f"❌ Memory consolidation failed for {user_id}: {e}")
+            continue
+        users.append(report)
+        if report["merged"] or report["expired"]:
+            logger.info(f"🧹 {user_id}: {report['before']['memories']} -> {report['after']['memories']} memories "
+                        f"({report['merged']} merged, {report['expired']} expired)")
+
+    return {
+        "dry_run": dry_run,
+        "users": users,
+        "failed": failed,
+        "before": {key: sum(r["before"][key] for r in users) for key in ("memories", "tokens")},
+        "after": {key: sum(r["after"][key] for r in users) for key in ("memories", "tokens")},
+        "merged": sum(r["merged"] for r in users),
+        "expired": sum(r["expired"] for r in users),
+        "storage_mb_before": size_before,
+        "storage_mb_after": _dir_size_mb(MEM0_STORAGE_PATH),
+        "seconds": round(time.time() - start_time, 1),
+    }
+
+def print_summary(summary):
+    title = "Memory consolidation (dry run)" if summary["dry_run"] else "Memory consolidation"
+    print(f"\n🧠 {title}: {len(summary['users'])} users in {summary['seconds']}s")
+    print(f"   Memories:   {summary['before']['memories']:,} -> {summary['after']['memories']:,} "
+          f"({summary['merged']} merged, {summary['expired']} stale fragments expired)")
+    print(f"   Tokens:     {summary['before']['tokens']:,} -> {summary['after']['tokens']:,}")
+    if summary["storage_mb_before"] is not None:
+        # Qdrant reclaims deleted points on its next optimization, the size may lag behind
+        print(f"   Storage:    {summary['storage_mb_before']} MB -> {summary['storage_mb_after']} MB")
+    for report in summary["users"]:
+        if report["merged"] or report["expired"]:
+            print(f"   {report['user_id']}: {report['before']['memories']} -> {report['after']['memories']} memories")
+    for failure in summary["failed"]:
+        print(f"   ❌ {failure['user_id']}: {failure['error']}")
+
+def _claim_run(interval_h: float) -> bool:
+    """Server mode: only the first replica to wake up in an interval runs the job."""
+    if not QDRANT_URL:
+        return True
+    last_run = get_shared_version(_LEASE_KEY)
+    if last_run and time.time_ns() - last_run < interval_h * 3600 * 1e9 * 0.5:
+        return False
+    bump_shared_version(_LEASE_KEY)
+    return True
+
+def start_consolidation_scheduler(memory, interval_h: float = MEMORY_CONSOLIDATION_INTERVAL_H,
+                                  apply: bool = MEMORY_CONSOLIDATION_APPLY):
+    """
+    Consolidate every user every `interval_h` hours in a daemon thread (0 = disabled).
+    With the async memory writer each user's pass runs on the writer thread, so no delete
+    overlaps a memory write and other users' writes wait for one user at most.
+    Until `apply` is set it only logs what it would delete.
+    """
+    if not interval_h:
+        return None
+
+    def _loop():
+        while True:
+            # Jitter, so replicas started together do not wake up at the same moment
+            time.sleep(interval_h * 3600 * random.uniform(1.0, 1.1))
+            try:
+                if not _claim_run(interval_h):
+                    logger.info("🧹 Memory consolidation already ran on another replica, skipping")
+                    continue
+                exclusive = get_memory_writer(memory).run_exclusive if MEMORY_WRITE_ASYNC else None
+                summary = run_consolidation(memory, dry_run=not apply, exclusive=exclusive)
+                title = "Memory consolidation (dry run)" if summary["dry_run"] else "Memory consolidation"
+                logger.info(f"🧹 {title}: {summary['before']['memories']} -> "
+                            f"{summary['after']['memories']} memories in {summary['seconds']}s")
+            except Exception as e:
+                logger.error(f"❌ Memory consolidation failed: {e}")
+
+    thread = threading.Thread(target=_loop, name="memory-consolidation", daemon=True)
+    thread.start()
+    return thread
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete near-exact duplicate user memories and expire stale fragments "
+                                                 "(dry run unless --apply).")
+    parser.add_argument("--user-id", action="append", default=None, help="User to consolidate (repeatable, default: all)")
+    parser.add_argument("--similarity", type=float, default=MEMORY_CONSOLIDATION_SIMILARITY,
+                        help=f"Cosine similarity for duplicates (default: {MEMORY_CONSOLIDATION_SIMILARITY})")
+    parser.add_argument("--fragment-ttl-days", type=float, default=MEMORY_FRAGMENT_TTL_DAYS,
+                        help=f"Age after which conversational fragments expire (default: {MEMORY_FRAGMENT_TTL_DAYS})")
+    parser.add_argument("--apply", action="store_true", help="Delete the memories (default: only report what would change)")
+    args = parser.parse_args(argv)
+
+    from src.memory import UserMemory
+    memory = UserMemory(user_id="SYSTEM_CONSOLIDATION").memory
+    summary = run_consolidation(memory, user_ids=args.user_id, threshold=args.similarity,
+                                ttl_days=args.fragment_ttl_days, dry_run=not args.apply)
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
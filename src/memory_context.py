@@ -0,0 +1,196 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config import (
+    MEMORY_CONTEXT_MAX_TOKENS, MEMORY_CONTEXT_TOP_K, MEMORY_CONTEXT_MIN_SIMILARITY, MEMORY_CONTEXT_MAX_PINNED,
+    MEMORY_CONTEXT_FETCH_LIMIT, MEMORY_CONTEXT_CACHE_USERS, MEMORY_PINNED_PATTERNS
+)
+from src.model_registry import get_embedding_model, count_tokens
+from src.query_encoder import get_query_encoder
+from src.vector_db import get_shared_version, bump_shared_version
+from src.utils import setup_logger, normalize_text
+
+logger = setup_logger(__name__)
+
+MEMORY_CONTEXT_HEADER = "Thông tin về người dùng (User Memory / Profile):"
+
+_PINNED_RE = re.compile("|".join(f"(?:{pattern})" for pattern in MEMORY_PINNED_PATTERNS), re.IGNORECASE)
+
+def memory_items(results):
+    """mem0 get_all/search output (dict or list, any version) -> [{"id", "text", ...}]."""
+    if isinstance(results, dict):
+        results = results.get("results", [])
+    if not isinstance(results, list):
+        return []
+    items = []
+    for m in results:
+        # Handle standard mem0 dictionary structure
+        if isinstance(m, dict):
+            # Typically mem0 returns {'memory': 'Fact string', ...} or {'text': ...}
+            text = m.get("memory") or m.get("text")
+            if text:
+                items.append({"id": m.get("id"), "text": text,
+                              "created_at": m.get("created_at"), "updated_at": m.get("updated_at")})
+        elif isinstance(m, str):
+            items.append({"id": None, "text": m})
+        # Handle Qdrant objects just in case
+        elif hasattr(m, "payload"):
+            text = m.payload.get("memory") or m.payload.get("text")
+            if text:
+                items.append({"id": getattr(m, "id", None), "text": text,
+                              "created_at": m.payload.get("created_at"), "updated_at": m.payload.get("updated_at")})
+    return items
+
+def is_pinned(text: str) -> bool:
+    return bool(_PINNED_RE.search(text))
+
+class MemoryContextBuilder:
+    """
+    Builds the memory part of the prompt: pinned profile facts (name, role, ...) first,
+    then the memories most similar to the question, until MEMORY_CONTEXT_MAX_TOKENS.
+
+    Each user's memories are served from an in-process LRU cache (MEMORY_CONTEXT_CACHE_USERS
+    users) until `invalidate(user_id)` (called after that user's memories are written). A
+    reload re-reads the memories but only embeds the ones not seen before.
+    The user's shared memory version is checked too, so writes made by another replica
+    (Qdrant server mode) also invalidate it.
+    """
+
+    def __init__(self, max_tokens: int = MEMORY_CONTEXT_MAX_TOKENS, top_k: int = MEMORY_CONTEXT_TOP_K,
+                 min_similarity: float = MEMORY_CONTEXT_MIN_SIMILARITY, max_users: int = MEMORY_CONTEXT_CACHE_USERS):
+        self.max_tokens = max_tokens
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.max_users = max(1, max_users)
+        self._lock = threading.Lock()
+        # user_id -> {"entry": {"pinned", "texts", "vectors", "version"} or None,
+        #             "vectors": {memory_id: (text, float16 vector)}}, least recently used first.
+        # Vectors outlive invalidations, so a reload only embeds memories it has not seen.
+        self._users = OrderedDict()
+        self._generation = {}  # user_id -> invalidation count (drops loads that raced a write)
+        self.hits = 0
+        self.loads = 0
+        self.embedded = 0
+        self.invalidations = 0
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if user_id in self._users:
+                self._users[user_id]["entry"] = None
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            self.invalidations += 1
+        bump_shared_version(f"memory:{user_id}")
+
+    def _load(self, memory, user_id):
+        version = get_shared_version(f"memory:{user_id}")
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                self._users.move_to_end(user_id)
+                entry = user["entry"]
+                if entry is not None and entry["version"] == version:
+                    self.hits += 1
+                    return entry
+            known = dict(user["vectors"]) if user is not None else {}
+            generation = self._generation.get(user_id, 0)
+
+        try:
+            results = memory.get_all(user_id=user_id, limit=MEMORY_CONTEXT_FETCH_LIMIT)
+        except TypeError:
+            # mem0 versions without a `limit` argument
+            results = memory.get_all(user_id=user_id)
+        items = memory_items(results)
+        # Exact duplicates (modulo whitespace) are kept once, first occurrence wins
+        seen = set()
+        pinned, ranked = [], []
+        for item in items:
+            key = normalize_text(item["text"]).lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            (pinned if is_pinned(item["text"]) and len(pinned) < MEMORY_CONTEXT_MAX_PINNED else ranked).append(item)
+
+        # Only new (or edited) memories are embedded; the rest reuse their cached vector
+        rows = [None] * len(ranked)
+        missing = []
+        for i, item in enumerate(ranked):
+            cached = known.get(item["id"]) if item["id"] else None
+            if cached is not None and cached[0] == item["text"]:
+                rows[i] = cached[1]
+            else:
+                missing.append(i)
+        if missing:
+            new_vectors = get_embedding_model().embed_documents([ranked[i]["text"] for i in missing])
+            for i, vector in zip(missing, new_vectors):
+                rows[i] = np.asarray(vector, dtype=np.float16)
+        vectors = {item["id"]: (item["text"], rows[i]) for i, item in enumerate(ranked) if item["id"]}
+        texts = [item["text"] for item in ranked]
+        matrix = np.stack(rows) if rows else None
+        entry = {"pinned": [item["text"] for item in pinned], "texts": texts, "vectors": matrix, "version": version}
+
+        with self._lock:
+            # A load that raced a write keeps its vectors but is not served from the cache
+            fresh = self._generation.get(user_id, 0) == generation
+            self._users[user_id] = {"entry": entry if fresh else None, "vectors": vectors}
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            self.loads += 1
+            self.embedded += len(missing)
+        logger.info(f"🧠 Loaded {len(pinned) + len(ranked)} memories for {user_id} "
+                    f"({len(pinned)} pinned, {len(missing)} embedded)")
+        return entry
+
+    def _ranked(self, entry, query):
+        """Non-pinned memories most relevant to `query` (stored order when there is no query)."""
+        texts, vectors = entry["texts"], entry["vectors"]
+        if not texts:
+            return []
+        if not query:
+            return texts[:self.top_k]
+        query_vector = np.asarray(get_query_encoder().embed_query(query), dtype=np.float32)
+        # bge-m3 vectors are normalized: dot product = cosine
+        scores = vectors.astype(np.float32) @ query_vector
+        order = np.argsort(-scores)[:self.top_k]
+        return [texts[i] for i in order if scores[i] >= self.min_similarity]
+
+    def build(self, memory, user_id, query=None) -> str:
+        entry = self._load(memory, user_id)
+        budget = self.max_tokens - count_tokens(MEMORY_CONTEXT_HEADER)
+        lines = []
+        for text in entry["pinned"] + self._ranked(entry, query):
+            line = f"- {text}"
+            cost = count_tokens(line) + 1
+            if cost > budget:
+                continue
+            lines.append(line)
+            budget -= cost
+        if not lines:
+            return ""
+        return MEMORY_CONTEXT_HEADER + "\n" + "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.loads
+            return {
+                "users_cached": len(self._users),
+                "hits": self.hits,
+                "loads": self.loads,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "embedded": self.embedded,
+                "invalidations": self.invalidations,
+            }
+
+_builder = None
+_builder_lock = threading.Lock()
+
+def get_memory_context_builder() -> MemoryContextBuilder:
+    """Process-wide memory context builder shared by all sessions."""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = MemoryContextBuilder()
+        return _builder
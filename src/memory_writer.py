@@ -0,0 +1,274 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+from src.config import (
+    MEMORY_WRITE_JOURNAL, MEMORY_WRITE_IDLE_S, MEMORY_WRITE_MAX_DELAY_S, MEMORY_WRITE_MAX_BATCH,
+    MEMORY_WRITE_RETRY_BACKOFF_S, MEMORY_WRITE_SHUTDOWN_TIMEOUT_S, MEMORY_WRITE_JOURNAL_MAX_MB
+)
+from src.memory_context import get_memory_context_builder
+from src.utils import setup_logger, normalize_text
+
+logger = setup_logger(__name__)
+
+def interaction_messages(entries):
+    """Interactions -> one mem0 conversation, so a whole batch costs a single extraction call."""
+    messages = []
+    for entry in entries:
+        messages.append({"role": "user", "content": entry["user"]})
+        messages.append({"role": "assistant", "content": entry["assistant"]})
+    return messages
+
+class MemoryWriteQueue:
+    """
+    Background writer for user memory (mem0 `Memory.add`).
+
+    Interactions are appended to a JSONL journal (fsynced) before `submit` returns, then
+    written per user in batches once the user has been idle for MEMORY_WRITE_IDLE_S,
+    the oldest turn has waited MEMORY_WRITE_MAX_DELAY_S, or MEMORY_WRITE_MAX_BATCH turns
+    are pending. Identical pending turns are coalesced. Journal records:
+
+    {"type": "add", "id": ..., "user_id": ..., "user": ..., "assistant": ..., "ts": ...}
+    {"type": "done", "ids": [...]}
+
+    Turns without a "done" record are replayed on startup; failed batches are retried.
+    Maintenance jobs that delete memories go through `run_exclusive`, so they never
+    overlap a write.
+    """
+
+    def __init__(self, memory_client, path: str = MEMORY_WRITE_JOURNAL):
+        self.memory = memory_client
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = {}  # user_id -> [entry, ...] (oldest first)
+        self._retry_at = {}  # user_id -> earliest retry time after a failed write
+        self._inflight = 0
+        self._flush_all = False
+        self._tasks = deque()  # (future, fn, args, kwargs) run on the worker thread between batches
+        self._listeners = []
+        self.stats_counters = {"submitted": 0, "coalesced": 0, "written": 0, "batches": 0,
+                               "failures": 0, "replayed": 0, "last_write_s": None}
+        self._load()
+        self._thread = threading.Thread(target=self._worker_loop, name="memory-writer", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            return
+        entries, done = {}, set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    continue
+                if record.get("type") == "add":
+                    entries[record["id"]] = record
+                elif record.get("type") == "done":
+                    done.update(record["ids"])
+        replay = [entry for entry_id, entry in entries.items() if entry_id not in done]
+        for entry in sorted(replay, key=lambda e: e["ts"]):
+            self._pending.setdefault(entry["user_id"], []).append(entry)
+        self.stats_counters["replayed"] = len(replay)
+        self._rewrite_journal_locked()
+        if replay:
+            # Written on the next worker pass, no need to wait for the user to come back
+            self._flush_all = True
+            logger.info(f"🔁 Replaying {len(replay)} unsaved memory interactions from {self.path}")
+
+    def _append(self, record):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal_locked(self):
+        """Compact the journal down to the turns not written yet."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entries in self._pending.values():
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def submit(self, user_id: str, user_input: str, system_response: str):
+        """Journal one interaction and return immediately (the write happens in the background)."""
+        key = (normalize_text(user_input), normalize_text(system_response))
+        with self._wakeup:
+            pending = self._pending.setdefault(user_id, [])
+            for entry in pending:
+                if (normalize_text(entry["user"]), normalize_text(entry["assistant"])) == key:
+                    # Same turn already waiting (e.g. a resubmitted question with a cached answer)
+                    entry["ts_last"] = time.time()
+                    self.stats_counters["coalesced"] += 1
+                    self._wakeup.notify()
+                    return entry["id"]
+            entry = {
+                "type": "add",
+                "id": uuid.uuid4().hex[:12],
+                "user_id": user_id,
+                "user": user_input,
+                "assistant": system_response,
+                "ts": time.time(),
+            }
+            self._append(entry)
+            entry["ts_last"] = entry["ts"]
+            pending.append(entry)
+            self.stats_counters["submitted"] += 1
+            self._wakeup.notify()
+        return entry["id"]
+
+    def add_listener(self, callback):
+        """`callback(user_id)` runs after a user's memories were written."""
+        self._listeners.append(callback)
+
+    def run_exclusive(self, fn, *args, **kwargs) -> Future:
+        """Run `fn` on the writer thread, between two batches; the Future holds its result."""
+        future = Future()
+        with self._wakeup:
+            self._tasks.append((future, fn, args, kwargs))
+            self._wakeup.notify()
+        return future
+
+    def pending_count(self, user_id: str = None) -> int:
+        with self._lock:
+            if user_id is not None:
+                return len(self._pending.get(user_id, []))
+            return sum(len(entries) for entries in self._pending.values())
+
+    def _due_locked(self, now):
+        """(user_id due for a write or None, seconds until the next one is due or None)."""
+        next_due = None
+        for user_id, entries in self._pending.items():
+            if not entries:
+                continue
+            retry_at = self._retry_at.get(user_id, 0)
+            if self._flush_all and retry_at <= now:
+                return user_id, 0
+            due_at = min(entries[-1].get("ts_last", entries[-1]["ts"]) + MEMORY_WRITE_IDLE_S,
+                         entries[0]["ts"] + MEMORY_WRITE_MAX_DELAY_S)
+            if len(entries) >= MEMORY_WRITE_MAX_BATCH:
+                due_at = now
+            due_at = max(due_at, retry_at)
+            if due_at <= now:
+                return user_id, 0
+            next_due = due_at - now if next_due is None else min(next_due, due_at - now)
+        return None, next_due
+
+    def _worker_loop(self):
+        while True:
+            task = None
+            with self._wakeup:
+                user_id, wait_s = self._due_locked(time.time())
+                while user_id is None and not self._tasks:
+                    if wait_s is None:
+                        self._flush_all = False
+                        self._wakeup.notify_all()
+                    self._wakeup.wait(timeout=wait_s)
+                    user_id, wait_s = self._due_locked(time.time())
+                if self._tasks:
+                    task = self._tasks.popleft()
+                else:
+                    batch = self._pending[user_id][:MEMORY_WRITE_MAX_BATCH]
+                    self._inflight += len(batch)
+            if task is not None:
+                self._run_task(*task)
+            else:
+                self._write(user_id, batch)
+
+    def _run_task(self, future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _write(self, user_id, batch):
+        start_time = time.time()
+        try:
+            self.memory.add(interaction_messages(batch), user_id=user_id)
+        except Exception as e:
+            with self._wakeup:
+                self._inflight -= len(batch)
+                self._retry_at[user_id] = time.time() + MEMORY_WRITE_RETRY_BACKOFF_S
+                self.stats_counters["failures"] += 1
+                self._wakeup.notify_all()
+            logger.error(f"❌ Memory write failed for {user_id} ({len(batch)} interactions), will retry: {e}")
+            return
+
+        elapsed = time.time() - start_time
+        ids = {entry["id"] for entry in batch}
+        with self._wakeup:
+            self._pending[user_id] = [entry for entry in self._pending[user_id] if entry["id"] not in ids]
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+            self._retry_at.pop(user_id, None)
+            self._inflight -= len(batch)
+            # Compacted whenever nothing is left, and at the size cap while some user is always pending
+            if not self._pending or os.path.getsize(self.path) > MEMORY_WRITE_JOURNAL_MAX_MB * 1024 * 1024:
+                self._rewrite_journal_locked()
+            else:
+                self._append({"type": "done", "ids": sorted(ids)})
+            self.stats_counters["written"] += len(batch)
+            self.stats_counters["batches"] += 1
+            self.stats_counters["last_write_s"] = round(elapsed, 2)
+            self._wakeup.notify_all()
+        logger.info(f"🧠 Saved {len(batch)} interactions to memory for {user_id} in {elapsed:.1f}s (one extraction call)")
+        for callback in self._listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Memory write listener failed: {e}")
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write every pending interaction now; True once nothing is left (False on timeout)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._wakeup:
+            self._flush_all = True
+            self._wakeup.notify_all()
+            while self._pending or self._inflight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(timeout=remaining)
+        return True
+
+    def _flush_at_exit(self):
+        if self.pending_count() and not self.flush(timeout=MEMORY_WRITE_SHUTDOWN_TIMEOUT_S):
+            logger.warning(f"⚠️ {self.pending_count()} memory interactions not written before exit; "
+                           f"they stay in {self.path} and are replayed on the next start")
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(entries) for entries in self._pending.values())
+            counters = dict(self.stats_counters)
+        batches = counters["batches"]
+        counters.update(pending=pending, avg_batch=round(counters["written"] / batches, 1) if batches else 0.0)
+        return counters
+
+_writer_instance = None
+_writer_lock = threading.Lock()
+
+def get_memory_writer(memory_client=None) -> MemoryWriteQueue:
+    """Process-wide writer; the first caller provides the shared mem0 client."""
+    global _writer_instance
+    with _writer_lock:
+        if _writer_instance is None:
+            if memory_client is None:
+                raise ValueError("The first get_memory_writer() call needs the mem0 client")
+            _writer_instance = MemoryWriteQueue(memory_client)
+            # The user's cached memory context is stale once new facts are written
+            _writer_instance.add_listener(get_memory_context_builder().invalidate)
+            atexit.register(_writer_instance._flush_at_exit)
+        return _writer_instance
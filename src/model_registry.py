@@ -0,0 +1,126 @@
+import threading
+import time
+import psutil
+from contextlib import contextmanager
+from src.config import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME, RERANKER_BACKEND, DEVICE, LLM_TOKENIZER_NAME
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Process-wide model instances, shared by ingestion, retrieval and memory.
+# Each model is loaded lazily on first use and never duplicated.
+_models = {}
+_load_stats = {}
+_locks = {}
+_locks_guard = threading.Lock()
+# Priority lane on the shared models: query-path calls in flight, background work yields to them
+_foreground = 0
+_foreground_cond = threading.Condition()
+
+def get_rss_mb():
+    """Current resident memory of this process in MB."""
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def _get_lock(key):
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+def get_or_load(key, loader):
+    """Return the model registered under `key`, loading it once with `loader()`."""
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    # Per-key lock: loading the reranker does not block the embedder
+    with _get_lock(key):
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        rss_before = get_rss_mb()
+        start_time = time.time()
+        logger.info(f"⏳ Loading model '{key}'...")
+        model = loader()
+        elapsed = time.time() - start_time
+        rss_after = get_rss_mb()
+
+        _load_stats[key] = {"load_time_s": round(elapsed, 2), "rss_mb": rss_after,
+                            "rss_delta_mb": round(rss_after - rss_before, 1)}
+        _models[key] = model
+
+        logger.info(f"✅ Model '{key}' loaded in {elapsed:.1f}s, RSS {rss_after:,.0f} MB")
+        return model
+
+@contextmanager
+def foreground_inference():
+    """Mark a live-query model call (query encoding, reranking) as running."""
+    global _foreground
+    with _foreground_cond:
+        _foreground += 1
+    try:
+        yield
+    finally:
+        with _foreground_cond:
+            _foreground -= 1
+            _foreground_cond.notify_all()
+
+def wait_for_foreground(timeout: float) -> bool:
+    """
+    Background (ingestion) work: block while live-query calls run, at most `timeout`
+    seconds so ingestion still progresses under constant traffic. False on timeout.
+    """
+    with _foreground_cond:
+        return _foreground_cond.wait_for(lambda: _foreground == 0, timeout=timeout)
+
+def get_bge_m3():
+    """Shared BGEM3FlagModel: dense and sparse (lexical) outputs from one forward pass."""
+    def _load():
+        from FlagEmbedding import BGEM3FlagModel
+        return BGEM3FlagModel(
+            EMBEDDING_MODEL_NAME,
+            normalize_embeddings=True,
+            use_fp16=DEVICE != "cpu",
+            devices=DEVICE
+        )
+    return get_or_load(EMBEDDING_MODEL_NAME, _load)
+
+def get_embedding_model():
+    """Shared bge-m3 embedder (LangChain Embeddings interface)."""
+    from src.embeddings import BGEM3Embeddings
+    return BGEM3Embeddings(get_bge_m3())
+
+def get_reranker_model():
+    """Shared bge-reranker cross-encoder (torch, int8 ONNX or OpenVINO, see RERANKER_BACKEND)."""
+    def _load():
+        from src.reranker import load_reranker
+        return load_reranker()
+    return get_or_load(f"{RERANKER_MODEL_NAME} ({RERANKER_BACKEND})", _load)
+
+class _ApproxTokenizer:
+    """Fallback when the LLM tokenizer cannot be loaded: ~4 characters per token."""
+
+    def encode(self, text, add_special_tokens=False):
+        return [0] * ((len(text) + 3) // 4)
+
+def get_llm_tokenizer():
+    """Shared tokenizer of the generation model (prompt token budgets)."""
+    def _load():
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(LLM_TOKENIZER_NAME)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load tokenizer {LLM_TOKENIZER_NAME} ({e}), estimating ~4 chars/token")
+            return _ApproxTokenizer()
+    return get_or_load(f"{LLM_TOKENIZER_NAME} (tokenizer)", _load)
+
+def count_tokens(text: str) -> int:
+    return len(get_llm_tokenizer().encode(text, add_special_tokens=False))
+
+def get_model_stats():
+    """Load time and memory figures for every model loaded so far."""
+    return {
+        "models": {key: dict(stats) for key, stats in _load_stats.items()},
+        "rss_mb": get_rss_mb(),
+    }
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+from src.config import (
+    RETRIEVAL_MODE, RERANK_MODE, QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE
+)
+from src.model_registry import get_embedding_model, foreground_inference
+from src.utils import setup_logger, normalize_text
+
+logger = setup_logger(__name__)
+
+class QueryEncoder:
+    """
+    Query-side embedding with an LRU + TTL cache keyed on normalized query text.
+
+    Cache misses are queued; a batcher thread waits up to `window_ms` after the first
+    one arrives (or until `max_batch` are pending) and encodes them in a single forward
+    pass. Identical queries in flight at the same time share one encoding.
+    """
+
+    def __init__(self, cache_size: int = QUERY_CACHE_SIZE, ttl_s: float = QUERY_CACHE_TTL_S,
+                 window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch: int = QUERY_BATCH_MAX_SIZE):
+        self.cache_size = cache_size
+        self.ttl_s = ttl_s
+        self.window_s = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.sparse = RETRIEVAL_MODE == "hybrid"
+        self.colbert = RERANK_MODE == "colbert"
+
+        self._cache = OrderedDict()  # key -> (record, expires_at)
+        # Also guards the counters below (updated from every session thread and the batcher)
+        self._cache_lock = threading.Lock()
+        self._pending = OrderedDict()  # key -> (text, Future), in arrival order
+        self._pending_cond = threading.Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.batch_sizes = Counter()
+        self.encode_s = 0.0
+
+        threading.Thread(target=self._batch_loop, name="query-encoder", daemon=True).start()
+
+    def _cache_get(self, key):
+        """Cached record or None; counts the hit or miss."""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._cache[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def _cache_put(self, key, record):
+        with self._cache_lock:
+            self._cache[key] = (record, time.time() + self.ttl_s)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def encode(self, query: str) -> dict:
+        """{"dense": [...], "sparse": {...} (hybrid mode), "colbert": [[...], ...] (colbert rerank mode)}."""
+        key = normalize_text(query)
+        record = self._cache_get(key)
+        if record is not None:
+            return record
+
+        with self._pending_cond:
+            if key in self._pending:
+                # Same query already waiting for the next batch
+                self.coalesced += 1
+                future = self._pending[key][1]
+            else:
+                future = Future()
+                # The normalized text is what gets encoded, so the cached record matches its key
+                self._pending[key] = (key, future)
+                self._pending_cond.notify()
+        # From the batch window on, ingestion embedding yields the model to this query
+        with foreground_inference():
+            return future.result()
+
+    def embed_query(self, query: str):
+        return self.encode(query)["dense"]
+
+    def _next_batch(self):
+        with self._pending_cond:
+            while not self._pending:
+                self._pending_cond.wait()
+            # Give concurrent sessions a few ms to join this forward pass
+            deadline = time.time() + self.window_s
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._pending_cond.wait(remaining)
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                key, (text, future) = self._pending.popitem(last=False)
+                batch.append((key, text, future))
+            return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                start_time = time.time()
+                records = get_embedding_model().encode([text for _, text, _ in batch], sparse=self.sparse,
+                                                 colbert=self.colbert)
+                with self._cache_lock:
+                    self.encode_s += time.time() - start_time
+                    self.batch_sizes[len(batch)] += 1
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (key, _, future), record in zip(batch, records):
+                self._cache_put(key, record)
+                future.set_result(record)
+
+    def stats(self):
+        with self._pending_cond:
+            coalesced = self.coalesced
+        with self._cache_lock:
+            total = self.hits + self.misses
+            batches = sum(self.batch_sizes.values())
+            encoded = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "coalesced": coalesced,
+                "expired": self.expired,
+                "batches": batches,
+                "avg_batch_size": round(encoded / batches, 2) if batches else 0.0,
+                "avg_encode_ms": round(self.encode_s / batches * 1000, 1) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            }
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_query_encoder() -> QueryEncoder:
+    """Process-wide query encoder shared by all sessions."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = QueryEncoder()
+        return _encoder
@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from src.config import QUERY_PIPELINE_WORKERS, RETRIEVAL_TIMEOUT_S, MEMORY_TIMEOUT_S, CONTEXT_PACKING
+from src.context_packer import pack_context
+from src.retrieval import get_retrieval_engine
+from src.vector_db import get_data_version
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+class QueryPipeline:
+    """
+    Per-turn orchestration before generation: retrieval and the user memory lookup
+    are independent, so they run concurrently on a shared thread pool. Each stage
+    has its own deadline (measured from the start of the turn) and a fallback, so
+    the time to first token is bounded by the slower stage, not the sum of both.
+    """
+
+    def __init__(self, engine=None, workers: int = QUERY_PIPELINE_WORKERS,
+                 retrieval_timeout_s: float = RETRIEVAL_TIMEOUT_S, memory_timeout_s: float = MEMORY_TIMEOUT_S):
+        self.engine = engine if engine is not None else get_retrieval_engine()
+        self.retrieval_timeout_s = retrieval_timeout_s
+        self.memory_timeout_s = memory_timeout_s
+        # A timed-out stage keeps its worker until it finishes: leave room for stragglers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._running = 0
+        self._running_lock = threading.Lock()
+
+    def _timed(self, fn, *args):
+        with self._running_lock:
+            self._running += 1
+        try:
+            start_time = time.time()
+            result = fn(*args)
+            return result, time.time() - start_time
+        finally:
+            with self._running_lock:
+                self._running -= 1
+
+    def running_stages(self) -> int:
+        """Stages executing on the pool right now (including timed-out stragglers)."""
+        with self._running_lock:
+            return self._running
+
+    def _wait(self, name, future, deadline, fallback, turn):
+        try:
+            result, elapsed = future.result(timeout=max(0.0, deadline - time.time()))
+            turn["timings"][name] = round(elapsed * 1000)
+            return result
+        except FutureTimeout:
+            # Only a stage still queued (pool busy with stragglers) can be cancelled;
+            # a running one finishes in the background and its result is dropped
+            if future.cancel():
+                logger.warning(f"⚠️ {name} stage timed out before starting (cancelled), continuing without it")
+            else:
+                logger.warning(f"⚠️ {name} stage timed out, continuing without it "
+                               f"({self.running_stages()} stages still running in the background)")
+        except Exception as e:
+            logger.error(f"❌ {name} stage failed ({e}), continuing without it")
+        turn["degraded"].append(name)
+        return fallback
+
+    def prepare(self, prompt: str, user_id, user_memory):
+        """
+        Run retrieval and memory lookup for one chat turn.
+        Returns {"docs", "context", "context_stats", "memory_context", "data_version", "timings", "degraded"}.
+        """
+        start_time = time.time()
+        turn = {"data_version": get_data_version(), "timings": {}, "degraded": []}
+
+        retrieval = self._pool.submit(self._timed, self.engine.invoke, prompt, user_id)
+        memory = self._pool.submit(self._timed, user_memory.get_context, prompt)
+
+        turn["docs"] = self._wait("retrieval", retrieval, start_time + self.retrieval_timeout_s, [], turn)
+        turn["memory_context"] = self._wait("memory", memory, start_time + self.memory_timeout_s, "", turn)
+        if CONTEXT_PACKING:
+            turn["context"], turn["context_stats"] = pack_context(turn["docs"])
+        else:
+            turn["context"] = "\n\n".join(doc.page_content for doc in turn["docs"])
+            turn["context_stats"] = None
+
+        turn["timings"]["total"] = round((time.time() - start_time) * 1000)
+        logger.info(f"⏱️ Turn context ready in {turn['timings']['total']} ms "
+                    f"(retrieval {turn['timings'].get('retrieval', '-')} ms, "
+                    f"memory {turn['timings'].get('memory', '-')} ms)")
+        return turn
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_query_pipeline() -> QueryPipeline:
+    """Process-wide query pipeline (shares the retrieval engine)."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = QueryPipeline()
+        return _pipeline
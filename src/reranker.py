@@ -0,0 +1,89 @@
+import os
+from typing import List, Tuple
+
+from langchain_core.cross_encoders import BaseCrossEncoder
+
+from src.config import (
+    RERANKER_MODEL_NAME, RERANKER_BACKEND, RERANKER_MAX_LENGTH, RERANKER_BATCH_SIZE,
+    RERANKER_ONNX_QUANTIZATION, RERANKER_EXPORT_DIR, DEVICE
+)
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+class BucketedCrossEncoder(BaseCrossEncoder):
+    """
+    LangChain cross-encoder over a sentence-transformers CrossEncoder (any backend).
+    Pairs are scored in batches of similar token length, so a short chunk is never
+    padded to the length of the longest candidate; scores come back in input order.
+    """
+
+    def __init__(self, model, batch_size: int = RERANKER_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+
+    def _pair_lengths(self, text_pairs):
+        tokenizer = self.model.tokenizer
+        encoded = tokenizer([query for query, _ in text_pairs], [text for _, text in text_pairs],
+                            truncation=True, max_length=self.model.max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        if not text_pairs:
+            return []
+        lengths = self._pair_lengths(text_pairs)
+        order = sorted(range(len(text_pairs)), key=lambda i: lengths[i])
+        scores = [0.0] * len(text_pairs)
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            batch_scores = self.model.predict([text_pairs[i] for i in bucket], batch_size=len(bucket))
+            for i, value in zip(bucket, batch_scores):
+                # Single relevance logit (or [neg, pos] for 2-label models)
+                scores[i] = float(value[-1] if getattr(value, "ndim", 0) else value)
+        return scores
+
+def _export_path(backend: str) -> str:
+    return os.path.join(RERANKER_EXPORT_DIR, f"{RERANKER_MODEL_NAME.replace('/', '__')}-{backend}")
+
+def _load_onnx_int8(max_length):
+    """ONNX Runtime model with int8 dynamic quantization, exported once to RERANKER_EXPORT_DIR."""
+    from sentence_transformers import CrossEncoder, export_dynamic_quantized_onnx_model
+
+    path = _export_path("onnx")
+    file_name = f"onnx/model_qint8_{RERANKER_ONNX_QUANTIZATION}.onnx"
+    if not os.path.exists(os.path.join(path, file_name)):
+        logger.info(f"📦 Exporting {RERANKER_MODEL_NAME} to int8 ONNX ({RERANKER_ONNX_QUANTIZATION}) at {path}...")
+        model = CrossEncoder(RERANKER_MODEL_NAME, backend="onnx", max_length=max_length)
+        model.save_pretrained(path)
+        export_dynamic_quantized_onnx_model(model, RERANKER_ONNX_QUANTIZATION, path)
+    return CrossEncoder(path, backend="onnx", max_length=max_length, model_kwargs={"file_name": file_name})
+
+def _load_openvino(max_length):
+    from sentence_transformers import CrossEncoder
+
+    path = _export_path("openvino")
+    if not os.path.exists(os.path.join(path, "openvino")):
+        logger.info(f"📦 Exporting {RERANKER_MODEL_NAME} to OpenVINO at {path}...")
+        CrossEncoder(RERANKER_MODEL_NAME, backend="openvino", max_length=max_length).save_pretrained(path)
+    return CrossEncoder(path, backend="openvino", max_length=max_length)
+
+def load_reranker(backend: str = RERANKER_BACKEND, max_length: int = RERANKER_MAX_LENGTH) -> BucketedCrossEncoder:
+    """Cross-encoder for `backend`; falls back to torch if the backend cannot be exported or loaded."""
+    from sentence_transformers import CrossEncoder
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RERANKER_BACKEND: {backend}")
+    if backend != "torch":
+        try:
+            model = _load_onnx_int8(max_length) if backend == "onnx" else _load_openvino(max_length)
+            return BucketedCrossEncoder(model)
+        except ImportError as e:
+            logger.warning(f"⚠️ Reranker backend '{backend}' unavailable ({e}), using torch. "
+                           f"Install with: pip install \"sentence-transformers[{backend}]\"")
+        except Exception as e:
+            # Unsupported op, missing optimum backend, corrupt export in RERANKER_EXPORT_DIR, ...
+            logger.error(f"❌ Reranker backend '{backend}' failed to load ({type(e).__name__}: {e}), using torch. "
+                         f"Deleting {_export_path(backend)} forces a fresh export.")
+    return BucketedCrossEncoder(CrossEncoder(RERANKER_MODEL_NAME, device=DEVICE, max_length=max_length))
@@ -1,64 +1,356 @@
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List
+
+import numpy as np
 
-from langchain_classic.retrievers import ContextualCompressionRetriever
 from langchain_classic.retrievers.document_compressors import CrossEncoderReranker
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+from langchain_core.documents import Document
 
-from src.vector_db import initialize_vector_store
-from src.config import TOP_K_RETRIEVAL, TOP_K_RERANK
+from src.vector_db import initialize_vector_store, get_collection_layout, get_data_version, get_search_params, multivector
+from src.model_registry import get_reranker_model, foreground_inference
+from src.query_encoder import get_query_encoder
+from src.utils import setup_logger, normalize_text
+from src.config import (
+    TOP_K_RETRIEVAL, TOP_K_RERANK, RETRIEVAL_MODE, HYBRID_FUSION, HYBRID_PREFETCH_K, COLLECTION_NAME,
+    RETRIEVAL_CACHE_SIZE, GLOBAL_TENANT, RERANK_MODE, MMR_FETCH_K, MMR_LAMBDA, ADAPTIVE_RERANK,
+    ADAPTIVE_SKIP_MARGIN, ADAPTIVE_SHORT_MARGIN, ADAPTIVE_SHORT_RERANK_K, ADAPTIVE_FLAT_SPREAD,
+    ADAPTIVE_WIDEN_FACTOR, ADAPTIVE_DECISION_LOG, ADAPTIVE_DECISION_LOG_MAX_MB, ADAPTIVE_DECISION_LOG_BACKUPS,
+    ADAPTIVE_DECISION_LOG_RAW_QUERIES
+)
 
 from qdrant_client.http import models
 
-def get_hybrid_retriever(vector_store, all_docs=None, user_id=None):
-    # Base params
-    search_kwargs = {
-        "k": TOP_K_RETRIEVAL,
-        "fetch_k": 20, 
-        "lambda_mult": 0.5
-    }
-    
-    # Advanced Filtering: User Docs OR Global Docs
-    if user_id:
-        filter_condition = models.Filter(
-            should=[
-                models.FieldCondition(
-                    key="metadata.user_id", 
-                    match=models.MatchValue(value=user_id)
-                ),
-                models.FieldCondition(
-                    key="metadata.user_id", 
-                    match=models.MatchValue(value="GLOBAL")
-                ),
-                # Fallback for old documents without user_id (treat as global if intended, or just include to be safe)
-                models.FieldCondition(
-                    key="metadata.user_id", 
-                    match=models.MatchValue(value="default")
-                )
-            ]
+logger = setup_logger(__name__)
+
+_decision_logger = None
+_decision_logger_lock = threading.Lock()
+
+def get_decision_logger():
+    """
+    Logger for ADAPTIVE_DECISION_LOG: one JSON line per message, size-capped by rotation.
+    Callers only enqueue; a listener thread does the file I/O.
+    """
+    global _decision_logger
+    with _decision_logger_lock:
+        if _decision_logger is None:
+            _decision_logger = logging.getLogger(f"{__name__}.decisions")
+            _decision_logger.setLevel(logging.INFO)
+            _decision_logger.propagate = False
+            handler = RotatingFileHandler(ADAPTIVE_DECISION_LOG, maxBytes=int(ADAPTIVE_DECISION_LOG_MAX_MB * 1024 * 1024),
+                                          backupCount=ADAPTIVE_DECISION_LOG_BACKUPS, encoding="utf-8", delay=True)
+            records = queue.Queue()
+            listener = QueueListener(records, handler)
+            listener.start()
+            atexit.register(listener.stop)
+            _decision_logger.addHandler(QueueHandler(records))
+        return _decision_logger
+
+def _anonymize(value) -> str:
+    return hashlib.sha256(normalize_text(str(value)).encode("utf-8")).hexdigest()[:16]
+
+def build_user_filter(user_id):
+    """Advanced Filtering: User Docs OR Global Docs (one match on the indexed tenant field)"""
+    if not user_id:
+        return None
+    tenants = [user_id] if user_id == GLOBAL_TENANT else [user_id, GLOBAL_TENANT]
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.user_id",
+                match=models.MatchAny(any=tenants)
+            )
+        ]
+    )
+
+def point_to_document(point, query_dense=None, dense_name=None) -> Document:
+    """
+    LangChain Document from a scored Qdrant point (LangChain payload layout). When the
+    point carries its dense vector, `_dense_score` is its cosine similarity to the query.
+    """
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = point.id
+    metadata["_score"] = point.score
+    if query_dense is not None and point.vector:
+        vector = point.vector[dense_name] if isinstance(point.vector, dict) else point.vector
+        # bge-m3 vectors are normalized: dot product = cosine similarity
+        metadata["_dense_score"] = float(np.dot(vector, query_dense))
+    return Document(id=str(point.id), page_content=payload.get("page_content", ""), metadata=metadata)
+
+def hybrid_search(client, record, query_filter=None, k=TOP_K_RETRIEVAL,
+                  prefetch_k=HYBRID_PREFETCH_K, fusion=HYBRID_FUSION) -> List[Document]:
+    """
+    Dense + sparse retrieval over bge-m3 outputs. `record` is the encoded query (dense
+    vector and lexical weights from the same pass); Qdrant fetches candidates for each
+    vector type and fuses them server-side with RRF or DBSF.
+    """
+    layout = get_collection_layout(client)
+    result = client.query_points(
+        collection_name=COLLECTION_NAME,
+        prefetch=_hybrid_prefetch(record, layout, query_filter, prefetch_k),
+        query=_fusion_query(fusion),
+        limit=k,
+        with_payload=True,
+        # Dense vectors of the fused hits give comparable scores for the adaptive policy
+        with_vectors=[layout["dense"]]
+    )
+    return [point_to_document(point, record["dense"], layout["dense"]) for point in result.points]
+
+def _hybrid_prefetch(record, layout, query_filter, prefetch_k):
+    return [
+        models.Prefetch(
+            query=record["dense"],
+            using=layout["dense"],
+            filter=query_filter,
+            params=get_search_params(),
+            limit=prefetch_k
+        ),
+        # Exact-term recall (policy codes, clause numbers)
+        models.Prefetch(
+            query=models.SparseVector(**record["sparse"]),
+            using=layout["sparse"],
+            filter=query_filter,
+            limit=prefetch_k
+        ),
+    ]
+
+def _fusion_query(fusion):
+    return models.FusionQuery(fusion=models.Fusion.DBSF if fusion == "dbsf" else models.Fusion.RRF)
+
+def colbert_rerank_search(client, record, query_filter=None, k=TOP_K_RERANK, candidates_k=TOP_K_RETRIEVAL,
+                          prefetch_k=HYBRID_PREFETCH_K, fusion=HYBRID_FUSION) -> List[Document]:
+    """
+    Late-interaction rerank in a single Qdrant call: the usual candidates (hybrid fusion,
+    or dense) are rescored with MaxSim between the query's and each chunk's ColBERT
+    multi-vectors, both produced by bge-m3. Replaces the cross-encoder forward pass.
+    """
+    layout = get_collection_layout(client)
+    if RETRIEVAL_MODE == "hybrid" and layout["sparse"]:
+        candidates = models.Prefetch(
+            prefetch=_hybrid_prefetch(record, layout, query_filter, prefetch_k),
+            query=_fusion_query(fusion),
+            limit=candidates_k
+        )
+    else:
+        candidates = models.Prefetch(
+            query=record["dense"],
+            using=layout["dense"],
+            filter=query_filter,
+            params=get_search_params(),
+            limit=candidates_k
         )
-        search_kwargs["filter"] = filter_condition
-        
-    return vector_store.as_retriever(
-        search_type="mmr", 
-        search_kwargs=search_kwargs
+    result = client.query_points(
+        collection_name=COLLECTION_NAME,
+        prefetch=candidates,
+        query=multivector(record["colbert"]),
+        using=layout["colbert"],
+        limit=k,
+        with_payload=True
     )
+    return [point_to_document(point) for point in result.points]
+
+def _dense_score(doc):
+    return doc.metadata.get("_dense_score", float("-inf"))
+
+def decide_rerank(docs):
+    """
+    Adaptive rerank policy from the candidates' dense scores.
+    Returns (action, margin, spread); action is "skip", "short", "widen" or "full".
+    """
+    scores = sorted((doc.metadata["_dense_score"] for doc in docs if "_dense_score" in doc.metadata), reverse=True)
+    if len(scores) < 2:
+        return "full", None, None
+    margin = scores[0] - scores[1]
+    spread = scores[0] - scores[-1]
+    if margin >= ADAPTIVE_SKIP_MARGIN:
+        return "skip", margin, spread
+    if spread <= ADAPTIVE_FLAT_SPREAD:
+        return "widen", margin, spread
+    if margin >= ADAPTIVE_SHORT_MARGIN:
+        return "short", margin, spread
+    return "full", margin, spread
+
+class RetrievalEngine:
+    """
+    One long-lived retrieval stack (vector store, embedder, reranker) shared by every
+    user and session. The tenant filter is built per query from `user_id`, so memory
+    stays flat as users grow; a data version bump only clears the result cache.
+    """
+
+    def __init__(self):
+        self.vector_store = initialize_vector_store()
+        self.client = self.vector_store.client
+        self.query_encoder = get_query_encoder()
 
-def get_advanced_retriever_chain(all_docs=None, user_id=None):
-    vector_store = initialize_vector_store()
-    
-    base_retriever = get_hybrid_retriever(vector_store, all_docs, user_id=user_id)
-    
-    # 3. Reranker
-    # Using BGE-Reranker-v2-M3
-    model_name = "BAAI/bge-reranker-v2-m3"
-    try:
-        model = HuggingFaceCrossEncoder(model_name=model_name)
-        compressor = CrossEncoderReranker(model=model, top_n=TOP_K_RERANK)
-        
-        compression_retriever = ContextualCompressionRetriever(
-            base_compressor=compressor,
-            base_retriever=base_retriever
+        # Cross-encoder only loaded when ColBERT reranking is not available
+        self._reranker = None
+        self._reranker_loaded = False
+        self._reranker_lock = threading.Lock()
+        if not self.colbert_ready():
+            self.get_reranker()
+
+        self._cache = OrderedDict()
+        self._cache_version = get_data_version()
+        self._cache_lock = threading.Lock()
+
+        self._decisions = Counter()
+        self._latencies = {}  # action -> recent latencies (ms)
+        self._log_lock = threading.Lock()
+
+    def colbert_ready(self) -> bool:
+        return RERANK_MODE == "colbert" and get_collection_layout(self.client)["colbert"] is not None
+
+    def get_reranker(self):
+        with self._reranker_lock:
+            if not self._reranker_loaded:
+                self._reranker_loaded = True
+                # 3. Reranker
+                # Using BGE-Reranker-v2-M3 (shared instance from the model registry)
+                try:
+                    self._reranker = CrossEncoderReranker(model=get_reranker_model(), top_n=TOP_K_RERANK)
+                except Exception as e:
+                    logger.error(f"❌ Reranker initialization failed: {e}. Returning base retrieval results.")
+            return self._reranker
+
+    def search(self, query: str, user_id=None, k: int = TOP_K_RETRIEVAL, widen: int = 1) -> List[Document]:
+        """
+        Candidate retrieval (before reranking) restricted to the user's and GLOBAL docs.
+        `widen` multiplies the per-vector candidate pool (prefetch / MMR fetch_k).
+        """
+        query_filter = build_user_filter(user_id)
+        # Cached / micro-batched query embedding shared across sessions
+        record = self.query_encoder.encode(query)
+        if RETRIEVAL_MODE == "hybrid" and get_collection_layout(self.client)["sparse"]:
+            return hybrid_search(self.client, record, query_filter, k=k, prefetch_k=HYBRID_PREFETCH_K * widen)
+
+        # Dense-only mode (or collection not migrated yet): MMR over dense vectors
+        results = self.vector_store.max_marginal_relevance_search_with_score_by_vector(
+            record["dense"],
+            k=k,
+            fetch_k=MMR_FETCH_K * widen,
+            lambda_mult=MMR_LAMBDA,
+            filter=query_filter,
+            search_params=get_search_params()
         )
-        return compression_retriever
-    except Exception as e:
-        print(f"Reranker initialization failed: {e}. Returning base retriever.")
-        return base_retriever
+        docs = []
+        for doc, score in results:
+            doc.metadata["_dense_score"] = score
+            docs.append(doc)
+        return docs
+
+    def _rerank(self, query: str, user_id, docs, reranker):
+        """Cross-encoder rerank under the adaptive policy. Returns (docs, decision)."""
+        if ADAPTIVE_RERANK:
+            action, margin, spread = decide_rerank(docs)
+        else:
+            action, margin, spread = "full", None, None
+        decision = {"action": action, "margin": margin, "spread": spread, "candidates": len(docs)}
+
+        if action == "skip":
+            # Decisive top hit: dense order is trusted as is
+            docs = sorted(docs, key=_dense_score, reverse=True)[:TOP_K_RERANK]
+            decision["reranked"] = 0
+            return docs, decision
+        if action == "short":
+            docs = sorted(docs, key=_dense_score, reverse=True)[:ADAPTIVE_SHORT_RERANK_K]
+        elif action == "widen":
+            # Flat scores: the right chunk may sit just outside the pool
+            docs = self.search(query, user_id=user_id, k=TOP_K_RETRIEVAL * ADAPTIVE_WIDEN_FACTOR,
+                               widen=ADAPTIVE_WIDEN_FACTOR)
+            decision["candidates"] = len(docs)
+        decision["reranked"] = len(docs)
+        with foreground_inference():
+            return list(reranker.compress_documents(docs, query)), decision
+
+    def _log_decision(self, query: str, user_id, decision, latency_ms: float):
+        action = decision["action"]
+        with self._log_lock:
+            self._decisions[action] += 1
+            latencies = self._latencies.setdefault(action, [])
+            latencies.append(latency_ms)
+            del latencies[:-1000]
+        margin = "-" if decision.get("margin") is None else f"{decision['margin']:.3f}"
+        logger.info(f"🎯 Rerank policy: {action} (margin {margin}, {decision['candidates']} candidates, "
+                    f"{decision.get('reranked', 0)} reranked) in {latency_ms:.0f} ms")
+        if ADAPTIVE_DECISION_LOG:
+            entry = dict(decision, ts=time.time(), adaptive=ADAPTIVE_RERANK, latency_ms=round(latency_ms, 1))
+            if ADAPTIVE_DECISION_LOG_RAW_QUERIES:
+                entry.update(query=query, user_id=user_id)
+            else:
+                # Same question -> same hash, so decisions can still be grouped per query
+                entry.update(query_hash=_anonymize(query), user_hash=_anonymize(user_id) if user_id else None)
+            get_decision_logger().info(json.dumps(entry, ensure_ascii=False))
+
+    def policy_stats(self):
+        """Queries per rerank decision with p50/p95 retrieval latency (ms)."""
+        with self._log_lock:
+            return {
+                action: {
+                    "queries": count,
+                    "p50_ms": round(float(np.percentile(self._latencies[action], 50)), 1),
+                    "p95_ms": round(float(np.percentile(self._latencies[action], 95)), 1),
+                }
+                for action, count in self._decisions.items()
+            }
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            version = get_data_version()
+            if version != self._cache_version:
+                # Documents changed: drop cached results, keep models
+                self._cache.clear()
+                self._cache_version = version
+                return None
+            docs = self._cache.get(key)
+            if docs is not None:
+                self._cache.move_to_end(key)
+            return docs
+
+    def _cache_put(self, key, docs, version):
+        with self._cache_lock:
+            if version != self._cache_version:
+                return
+            self._cache[key] = docs
+            self._cache.move_to_end(key)
+            while len(self._cache) > RETRIEVAL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def invoke(self, query: str, user_id=None) -> List[Document]:
+        """Retrieve and rerank context documents for `query` as seen by `user_id`."""
+        key = (user_id, normalize_text(query))
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached)
+
+        version = get_data_version()
+        if self.colbert_ready():
+            # Candidates + MaxSim rerank server-side: no reranker forward pass
+            docs = colbert_rerank_search(self.client, self.query_encoder.encode(query), build_user_filter(user_id))
+        else:
+            start_time = time.time()
+            docs = self.search(query, user_id=user_id)
+            reranker = self.get_reranker()
+            if reranker is not None and docs:
+                docs, decision = self._rerank(query, user_id, docs, reranker)
+                self._log_decision(query, user_id, decision, (time.time() - start_time) * 1000)
+        self._cache_put(key, docs, version)
+        return list(docs)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_retrieval_engine() -> RetrievalEngine:
+    """Process-wide retrieval engine."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RetrievalEngine()
+        return _engine
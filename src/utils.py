@@ -1,6 +1,10 @@
 
 import logging
+import re
 import sys
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
 
 def setup_logger(name=__name__):
     logger = logging.getLogger(name)
@@ -11,3 +15,8 @@ def setup_logger(name=__name__):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
     return logger
+
+def normalize_text(text: str) -> str:
+    """Normalize text so cosmetic whitespace/unicode differences hash identically."""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
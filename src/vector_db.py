@@ -1,106 +1,648 @@
 
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+import numpy as np
 from langchain_qdrant import QdrantVectorStore
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models
-from src.config import EMBEDDING_MODEL_NAME, DEVICE, COLLECTION_NAME, DB_PATH
+from src.config import (
+    COLLECTION_NAME, DB_PATH, EMBEDDING_DIM, RETRIEVAL_MODE, DENSE_VECTOR_NAME, SPARSE_VECTOR_NAME,
+    GLOBAL_TENANT, LEGACY_TENANT, VECTOR_STORAGE_MODE, VECTORS_ON_DISK, QUANTIZATION_RESCORE,
+    QUANTIZATION_OVERSAMPLING, MANIFEST_COLLECTION_NAME, DOCUMENT_PAGE_SIZE, QDRANT_URL, QDRANT_API_KEY,
+    QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT, QDRANT_TIMEOUT, UPSERT_MAX_RETRIES, UPSERT_RETRY_BACKOFF_S,
+    RERANK_MODE, COLBERT_VECTOR_NAME, STATE_COLLECTION_NAME, DATA_VERSION_REFRESH_S
+)
+from src import model_registry
+from src.manifest import delete_manifest, normalize_manifest_tenants, list_manifests, save_manifest
+from src.utils import setup_logger
+
+logger = setup_logger(__name__)
 
 def get_embedding_model():
-    model_kwargs = {"device": DEVICE}
-    encode_kwargs = {"normalize_embeddings": True}
-    return HuggingFaceBgeEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs=model_kwargs,
-        encode_kwargs=encode_kwargs
-    )
+    # Shared instance from the process-wide registry (loaded once)
+    return model_registry.get_embedding_model()
 
 _client_instance = None
 
+# Cache invalidation versions ("data" for chunks, "memory:<user>" for user memories).
+# Embedded mode: process-wide values. Server mode: stored in STATE_COLLECTION_NAME so that
+# an ingest/delete on one replica invalidates the caches of every replica.
+_versions = {}  # key -> (version, read_at)
+_versions_lock = threading.Lock()
+_state_ready = False
+
+def _state_point_id(key: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{STATE_COLLECTION_NAME}/{key}"))
+
+def _ensure_state_collection(client):
+    global _state_ready
+    if not _state_ready:
+        if not client.collection_exists(STATE_COLLECTION_NAME):
+            # Payload-only store, same placeholder vector as the manifest collection
+            client.create_collection(
+                collection_name=STATE_COLLECTION_NAME,
+                vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT)
+            )
+        _state_ready = True
+
+def get_shared_version(key: str) -> int:
+    """Current version of `key`; any change means caches built on it are stale."""
+    with _versions_lock:
+        cached = _versions.get(key)
+    if not QDRANT_URL or (cached and time.time() - cached[1] < DATA_VERSION_REFRESH_S):
+        return cached[0] if cached else 0
+    try:
+        client = get_qdrant_client()
+        _ensure_state_collection(client)
+        points = client.retrieve(collection_name=STATE_COLLECTION_NAME, ids=[_state_point_id(key)],
+                                 with_payload=True, with_vectors=False)
+        version = points[0].payload["version"] if points else 0
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read shared version '{key}': {e}")
+        return cached[0] if cached else 0
+    with _versions_lock:
+        _versions[key] = (version, time.time())
+    return version
+
+def bump_shared_version(key: str) -> int:
+    """Mark `key` as changed (for every replica in server mode)."""
+    with _versions_lock:
+        previous = _versions.get(key, (0, 0))[0]
+        # Unique across replicas without a read-modify-write: only equality is ever compared
+        version = max(time.time_ns(), previous + 1)
+        _versions[key] = (version, time.time())
+    if QDRANT_URL:
+        client = get_qdrant_client()
+        _ensure_state_collection(client)
+        client.upsert(
+            collection_name=STATE_COLLECTION_NAME,
+            points=[models.PointStruct(id=_state_point_id(key), vector=[1.0], payload={"key": key, "version": version})]
+        )
+    return version
+
+def get_data_version():
+    return get_shared_version("data")
+
+def bump_data_version():
+    return bump_shared_version("data")
+
+def _server_kwargs():
+    return {
+        "url": QDRANT_URL,
+        "api_key": QDRANT_API_KEY,
+        "prefer_grpc": QDRANT_PREFER_GRPC,
+        "grpc_port": QDRANT_GRPC_PORT,
+        "timeout": QDRANT_TIMEOUT,
+    }
+
 def get_qdrant_client():
     global _client_instance
     if _client_instance is None:
-        # Persistent local storage
-        _client_instance = QdrantClient(path=DB_PATH)
+        if QDRANT_URL:
+            # Qdrant server (gRPC when preferred): shared by any number of app processes
+            _client_instance = QdrantClient(**_server_kwargs())
+            logger.info(f"🔌 Connected to Qdrant server at {QDRANT_URL} (gRPC: {QDRANT_PREFER_GRPC})")
+        else:
+            # Persistent local storage
+            _client_instance = QdrantClient(path=DB_PATH)
     return _client_instance
 
-def initialize_vector_store(client=None):
+_async_client = None
+_async_loop = None
+_async_lock = threading.Lock()
+
+def _get_async_client():
+    """
+    Async server client living on its own event loop thread. Its single gRPC channel
+    multiplexes every in-flight request, so concurrent upserts share one connection pool.
+    """
+    global _async_client, _async_loop
+    with _async_lock:
+        if _async_client is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="qdrant-async", daemon=True).start()
+
+            async def create():
+                return AsyncQdrantClient(**_server_kwargs())
+
+            _async_client = asyncio.run_coroutine_threadsafe(create(), loop).result()
+            _async_loop = loop
+        return _async_client, _async_loop
+
+def is_embedded(client) -> bool:
+    """True for the in-process local Qdrant (no payload indexes, quantization or on-disk vectors)."""
+    from qdrant_client.local.qdrant_local import QdrantLocal
+    return isinstance(getattr(client, "_client", None), QdrantLocal)
+
+def quantization_config(mode=VECTOR_STORAGE_MODE):
+    """Qdrant quantization config for a storage mode (None = plain float32)."""
+    if mode == "int8":
+        # Quantized copy pinned in RAM; 0.99 quantile clips outliers for a tighter int8 range
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if mode != "float32":
+        raise ValueError(f"Unknown VECTOR_STORAGE_MODE: {mode}")
+    return None
+
+def vectors_on_disk(mode=VECTOR_STORAGE_MODE) -> bool:
+    # Originals only leave RAM when a quantized copy serves the search
+    return VECTORS_ON_DISK and mode != "float32"
+
+def get_search_params(mode=VECTOR_STORAGE_MODE):
+    """Dense search params: oversample on quantized vectors, then rescore with the originals."""
+    if mode == "float32":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=QUANTIZATION_RESCORE,
+            oversampling=QUANTIZATION_OVERSAMPLING
+        )
+    )
+
+def _create_collection(client, collection_name):
+    """Create a chunk collection with the layout for the configured retrieval and storage modes."""
+    # BGE-M3 dimension is 1024
+    sparse_vectors_config = None
+    if RETRIEVAL_MODE == "hybrid":
+        # bge-m3 lexical weights are already term-weighted: no IDF modifier
+        sparse_vectors_config = {SPARSE_VECTOR_NAME: models.SparseVectorParams()}
+    vectors_config = {
+        # Quantization is set per vector, never collection-wide, so it only applies to dense
+        DENSE_VECTOR_NAME: models.VectorParams(
+            size=EMBEDDING_DIM,
+            distance=models.Distance.COSINE,
+            on_disk=vectors_on_disk(),
+            quantization_config=quantization_config()
+        )
+    }
+    if RERANK_MODE == "colbert":
+        # Token-level vectors, only used to rerank candidates: no HNSW graph (m=0), no quantized
+        # copy (MaxSim scores the originals), float16 on disk (2 KB per token instead of 4 KB in RAM)
+        vectors_config[COLBERT_VECTOR_NAME] = models.VectorParams(
+            size=EMBEDDING_DIM,
+            distance=models.Distance.COSINE,
+            multivector_config=models.MultiVectorConfig(comparator=models.MultiVectorComparator.MAX_SIM),
+            hnsw_config=models.HnswConfigDiff(m=0),
+            datatype=models.Datatype.FLOAT16,
+            on_disk=True
+        )
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=vectors_config,
+        sparse_vectors_config=sparse_vectors_config
+    )
+    ensure_payload_indexes(client, collection_name)
+
+# Payload fields every filtered search / delete goes through
+PAYLOAD_INDEXES = {
+    # Tenant index: Qdrant co-locates each user's points, so per-user filtered HNSW stays fast
+    "metadata.user_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+    "metadata.source": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD),
+}
+
+def ensure_payload_indexes(client, collection_name=COLLECTION_NAME):
+    """Create missing keyword payload indexes (no-op in embedded/local mode)."""
+    if is_embedded(client):
+        return
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=schema
+            )
+
+def _tenant_filter(user_id):
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.user_id",
+                match=models.MatchValue(value=user_id)
+            )
+        ]
+    )
+
+def normalize_legacy_tenants(client=None):
+    """
+    Rewrite points stored with the legacy "default" owner to the global tenant, so the
+    user filter is a single indexed match. Returns the number of points rewritten.
+    """
+    if client is None:
+        client = get_qdrant_client()
+    legacy = _tenant_filter(LEGACY_TENANT)
+    count = client.count(collection_name=COLLECTION_NAME, count_filter=legacy, exact=True).count
+    if count:
+        # key="metadata": update the nested field only, keep the rest of the metadata
+        client.set_payload(
+            collection_name=COLLECTION_NAME,
+            payload={"user_id": GLOBAL_TENANT},
+            key=QdrantVectorStore.METADATA_KEY,
+            points=models.FilterSelector(filter=legacy)
+        )
+        logger.info(f"🔧 Normalized {count:,} legacy '{LEGACY_TENANT}' points to '{GLOBAL_TENANT}'")
+    normalize_manifest_tenants(client)
+    return count
+
+_bootstrapped = False
+
+def ensure_collection(client=None):
+    """Create the chunk collection if it does not exist yet (indexes + tenant layout once per process)."""
+    global _bootstrapped
     if client is None:
         client = get_qdrant_client()
-    
-    embeddings = get_embedding_model()
-    
-    # Ensure collection exists
     try:
         client.get_collection(COLLECTION_NAME)
     except Exception:
         # Create collection if not exists
-        # BGE-M3 dimension is 1024
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=models.VectorParams(size=1024, distance=models.Distance.COSINE)
-        )
+        _create_collection(client, COLLECTION_NAME)
+        _reset_layout()
+    if not _bootstrapped:
+        # Existing collections may predate payload indexes / tenant normalization
+        ensure_payload_indexes(client)
+        normalize_legacy_tenants(client)
+        _bootstrapped = True
+    return client
+
+_layout = None
+_layout_version = None
+
+def _reset_layout():
+    global _layout
+    _layout = None
+
+def get_collection_layout(client=None):
+    """
+    Vector names present in the chunk collection:
+    {"dense": name, "sparse": name or None, "colbert": name or None}.
+    Collections created before hybrid retrieval have one unnamed dense vector ("").
+    """
+    global _layout, _layout_version
+    # A migration on another replica bumps the data version
+    version = get_data_version()
+    if _layout is None or _layout_version != version:
+        client = ensure_collection(client)
+        params = client.get_collection(COLLECTION_NAME).config.params
+        if isinstance(params.vectors, models.VectorParams):
+            dense = ""
+        else:
+            dense = DENSE_VECTOR_NAME if DENSE_VECTOR_NAME in params.vectors else next(iter(params.vectors))
+        sparse = SPARSE_VECTOR_NAME if SPARSE_VECTOR_NAME in (params.sparse_vectors or {}) else None
+        colbert = COLBERT_VECTOR_NAME if dense and COLBERT_VECTOR_NAME in params.vectors else None
+        if RETRIEVAL_MODE == "hybrid" and sparse is None:
+            logger.warning("⚠️ Collection has no sparse vectors, hybrid retrieval falls back to dense. "
+                           "Run `python -m src.vector_db migrate` to upgrade it.")
+        if RERANK_MODE == "colbert" and colbert is None:
+            logger.warning("⚠️ Collection has no ColBERT vectors, reranking falls back to the cross-encoder. "
+                           "Run `python -m src.vector_db migrate` to upgrade it.")
+        _layout = {"dense": dense, "sparse": sparse, "colbert": colbert}
+        _layout_version = version
+    return _layout
+
+def initialize_vector_store(client=None, embeddings=None):
+    client = ensure_collection(client)
+    
+    if embeddings is None:
+        embeddings = get_embedding_model()
     
     return QdrantVectorStore(
         client=client,
         collection_name=COLLECTION_NAME,
         embedding=embeddings,
+        vector_name=get_collection_layout(client)["dense"],
     )
 
-def list_documents():
-    """List unique source documents in the DB."""
+def list_documents(offset=None, limit: int = DOCUMENT_PAGE_SIZE):
+    """
+    One page of ingested source documents from the catalog (one manifest per source).
+    Returns ({source: info}, next_offset); next_offset is None on the last page.
+    """
     client = get_qdrant_client()
     try:
-        # Scroll through points to get metadata
-        # Note: This is inefficient for large datasets but fine for this scale
-        scroll_result, _ = client.scroll(
-            collection_name=COLLECTION_NAME,
-            scroll_filter=None,
-            limit=10000,
-            with_payload=True,
-            with_vectors=False
-        )
-        
-        unique_sources = set()
+        entries, next_offset = list_manifests(client, offset=offset, limit=limit)
+        if offset is None and not entries and client.collection_exists(COLLECTION_NAME) \
+                and _count(client, COLLECTION_NAME):
+            # Chunks ingested before the catalog existed
+            rebuild_catalog(client)
+            entries, next_offset = list_manifests(client, offset=offset, limit=limit)
+
         doc_info = {}
-        
-        for point in scroll_result:
-            if point.payload:
-                # Handle LangChain structure where metadata is nested
-                metadata = point.payload.get("metadata", point.payload)
-                
-                if "source" in metadata:
-                    source = metadata["source"]
-                    user_id = metadata.get("user_id", "unknown")
-                    
-                    if source not in unique_sources:
-                        unique_sources.add(source)
-                        doc_info[source] = {"user_id": user_id, "count": 1}
-                    else:
-                        doc_info[source]["count"] += 1
-                    
-        return doc_info
+        for entry in entries:
+            doc_info[entry["source"]] = {
+                "user_id": entry.get("user_id", "unknown"),
+                "count": entry.get("chunk_count", 0),
+                "size_bytes": entry.get("size_bytes"),
+                "content_hash": entry.get("content_hash"),
+                "ingested_at": entry.get("updated_at"),
+            }
+        return doc_info, next_offset
     except Exception as e:
         print(f"Error listing docs: {e}")
-        return {}
+        return {}, None
+
+def rebuild_catalog(client=None, batch_size: int = 1000):
+    """
+    Recreate the catalog from the chunk collection (recovery). Streams a paginated
+    scroll with only source/owner payload fields and no vectors. Size and content
+    hash are kept from existing entries, otherwise unknown until the next ingest.
+    """
+    if client is None:
+        client = get_qdrant_client()
+    client = ensure_collection(client)
+    sources = {}  # source -> {"ids": [...], "owners": {user_id: count}}
+    offset = None
+    scanned = 0
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            offset=offset,
+            limit=batch_size,
+            with_payload=models.PayloadSelectorInclude(include=["metadata.source", "metadata.user_id"]),
+            with_vectors=False
+        )
+        for point in points:
+            metadata = (point.payload or {}).get(QdrantVectorStore.METADATA_KEY) or {}
+            if "source" not in metadata:
+                continue
+            entry = sources.setdefault(metadata["source"], {"ids": [], "owners": {}})
+            entry["ids"].append(str(point.id))
+            owner = metadata.get("user_id", GLOBAL_TENANT)
+            entry["owners"][owner] = entry["owners"].get(owner, 0) + 1
+        scanned += len(points)
+        if offset is None:
+            break
+
+    # Drop catalog entries whose chunks are gone, keep file info of the others
+    existing, stale, page = {}, [], None
+    while True:
+        entries, page = list_manifests(client, offset=page, limit=batch_size)
+        for entry in entries:
+            if entry["source"] in sources:
+                existing[entry["source"]] = entry
+            else:
+                stale.append(entry["source"])
+        if page is None:
+            break
+    for source in stale:
+        delete_manifest(client, source)
+
+    for source, entry in sources.items():
+        owner = max(entry["owners"], key=entry["owners"].get)
+        previous = existing.get(source, {})
+        save_manifest(client, source, owner, entry["ids"],
+                      size_bytes=previous.get("size_bytes"), content_hash=previous.get("content_hash"))
+    bump_data_version()
+    logger.info(f"📚 Catalog rebuilt: {len(sources):,} documents from {scanned:,} chunks "
+                f"({len(stale)} stale entries removed)")
+    return len(sources)
+
+def multivector(vectors):
+    """ColBERT (tokens, dim) array -> the nested float lists Qdrant expects."""
+    return np.asarray(vectors, dtype=np.float32).tolist()
+
+def _point_vectors(record, layout):
+    """Named vectors for a point from an embedding record, following the collection layout."""
+    if not layout["dense"]:
+        return record["dense"]
+    vectors = {layout["dense"]: record["dense"]}
+    if layout["sparse"] and record.get("sparse"):
+        vectors[layout["sparse"]] = models.SparseVector(**record["sparse"])
+    if layout["colbert"] and record.get("colbert") is not None:
+        vectors[layout["colbert"]] = multivector(record["colbert"])
+    return vectors
+
+def build_point(doc, record):
+    """Qdrant point for a chunk with precomputed vectors (LangChain payload layout)."""
+    return models.PointStruct(
+        id=doc.id,
+        vector=_point_vectors(record, get_collection_layout()),
+        payload={
+            QdrantVectorStore.CONTENT_KEY: doc.page_content,
+            QdrantVectorStore.METADATA_KEY: doc.metadata,
+        }
+    )
+
+def upsert_points(points):
+    client = get_qdrant_client()
+    client.upsert(collection_name=COLLECTION_NAME, points=points)
+
+async def _upsert_with_retries(client, points):
+    for attempt in range(UPSERT_MAX_RETRIES + 1):
+        try:
+            await client.upsert(collection_name=COLLECTION_NAME, points=points, wait=True)
+            return
+        except Exception as e:
+            if attempt == UPSERT_MAX_RETRIES:
+                raise
+            delay = UPSERT_RETRY_BACKOFF_S * 2 ** attempt
+            logger.warning(f"⚠️ Upsert of {len(points)} points failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def upsert_points_async(points) -> Future:
+    """
+    Start an upsert and return a Future. Against a server, batches run concurrently
+    on the async client with retries; embedded storage upserts synchronously.
+    """
+    if not QDRANT_URL:
+        future = Future()
+        try:
+            upsert_points(points)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    client, loop = _get_async_client()
+    return asyncio.run_coroutine_threadsafe(_upsert_with_retries(client, points), loop)
+
+def _source_filter(source_name: str):
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.source",
+                match=models.MatchValue(value=source_name)
+            )
+        ]
+    )
+
+def delete_source_points(source_name: str, keep_ids=None, user_id=None):
+    """
+    Delete every chunk point of a source except `keep_ids` (without touching its manifest),
+    only those owned by `user_id` when given.
+    """
+    client = get_qdrant_client()
+    source_filter = _source_filter(source_name)
+    if user_id is not None:
+        source_filter.must.append(models.FieldCondition(key="metadata.user_id", match=models.MatchValue(value=user_id)))
+    if keep_ids:
+        source_filter.must_not = [models.HasIdCondition(has_id=list(keep_ids))]
+    client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=models.FilterSelector(filter=source_filter)
+    )
+
+def delete_points(point_ids):
+    """Delete chunk points by ID."""
+    if not point_ids:
+        return
+    client = get_qdrant_client()
+    client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=models.PointIdsList(points=list(point_ids))
+    )
 
 def delete_document(source_name: str):
     """Delete all chunks belonging to a specific source document."""
     client = get_qdrant_client()
     try:
-        client.delete(
-            collection_name=COLLECTION_NAME,
-            points_selector=models.FilterSelector(
-                filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="metadata.source",
-                            match=models.MatchValue(value=source_name)
-                        )
-                    ]
-                )
-            )
-        )
+        delete_source_points(source_name)
+        delete_manifest(client, source_name)
+        bump_data_version()
         return True
     except Exception as e:
         print(f"Error deleting doc {source_name}: {e}")
         return False
+
+def _copy_points(client, source, target, batch_size, add_vectors=None):
+    """Stream all points from `source` into `target`, optionally recomputing vectors per page."""
+    offset = None
+    copied = 0
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if not points:
+            break
+        new_points = add_vectors(points) if add_vectors else [
+            models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points
+        ]
+        client.upsert(collection_name=target, points=new_points)
+        copied += len(points)
+        logger.info(f"   Copied {copied:,} points to {target}")
+        if offset is None:
+            break
+    return copied
+
+def _count(client, collection_name):
+    return client.count(collection_name=collection_name, exact=True).count
+
+def _recover_interrupted_migration(client, tmp_name, batch_size):
+    """
+    The temp collection is complete once the build phase ends, so after a crash:
+    tmp holds more points than the original -> the copy-back was interrupted, finish it;
+    otherwise the build was interrupted (or already copied back) -> drop tmp.
+    """
+    if not client.collection_exists(tmp_name):
+        return
+    if not client.collection_exists(COLLECTION_NAME) or _count(client, tmp_name) > _count(client, COLLECTION_NAME):
+        logger.warning("⚠️ Resuming interrupted migration copy-back")
+        if client.collection_exists(COLLECTION_NAME):
+            client.delete_collection(COLLECTION_NAME)
+        _create_collection(client, COLLECTION_NAME)
+        _copy_points(client, tmp_name, COLLECTION_NAME, batch_size)
+        _reset_layout()
+    client.delete_collection(tmp_name)
+
+def migrate_collection(batch_size: int = 256):
+    """
+    Rebuild the chunk collection with the current layout (named dense vector, plus
+    sparse lexical vectors in hybrid mode and ColBERT multi-vectors in colbert rerank
+    mode). Existing dense vectors are kept; the other vectors are computed from the
+    stored chunk text (sparse from the embedding cache first; multi-vectors are not cached).
+    """
+    from src.embedding_cache import get_embedding_cache
+
+    client = get_qdrant_client()
+    tmp_name = f"{COLLECTION_NAME}__migrate"
+    _recover_interrupted_migration(client, tmp_name, batch_size)
+    _create_collection(client, tmp_name)
+
+    old_layout = get_collection_layout(client)
+    cache = get_embedding_cache()
+    need_sparse = RETRIEVAL_MODE == "hybrid"
+    need_colbert = RERANK_MODE == "colbert"
+
+    def upgrade(points):
+        texts = [p.payload.get(QdrantVectorStore.CONTENT_KEY, "") for p in points]
+        if need_sparse or need_colbert:
+            records, misses = cache.lookup(texts)
+            if misses:
+                miss_texts = [texts[idx[0]] for idx in misses.values()]
+                cache.fill(records, misses, miss_texts,
+                           get_embedding_model().encode(miss_texts, sparse=need_sparse, colbert=need_colbert))
+        new_points = []
+        for i, p in enumerate(points):
+            dense = p.vector if not old_layout["dense"] else p.vector[old_layout["dense"]]
+            vectors = {DENSE_VECTOR_NAME: dense}
+            if need_sparse:
+                vectors[SPARSE_VECTOR_NAME] = models.SparseVector(**records[i]["sparse"])
+            if need_colbert:
+                vectors[COLBERT_VECTOR_NAME] = multivector(records[i]["colbert"])
+            new_points.append(models.PointStruct(id=p.id, vector=vectors, payload=p.payload))
+        return new_points
+
+    logger.info(f"🔧 Migrating {COLLECTION_NAME} (layout {old_layout})...")
+    total = _copy_points(client, COLLECTION_NAME, tmp_name, batch_size, add_vectors=upgrade)
+    cache.flush()
+
+    # Swap: recreate the original name with the new layout and copy back
+    client.delete_collection(COLLECTION_NAME)
+    _create_collection(client, COLLECTION_NAME)
+    _copy_points(client, tmp_name, COLLECTION_NAME, batch_size)
+    client.delete_collection(tmp_name)
+    _reset_layout()
+    bump_data_version()
+    logger.info(f"✅ Migration complete: {total:,} points, layout {get_collection_layout(client)}")
+    return total
+
+def apply_storage_mode(client=None):
+    """
+    Switch an existing collection to VECTOR_STORAGE_MODE in place: Qdrant re-quantizes (or drops
+    the quantized copy) and moves the originals on/off disk in the background, no re-embedding.
+    Search params and migrations read the same setting, so the mode is only ever set in config.
+    """
+    mode = VECTOR_STORAGE_MODE
+    client = ensure_collection(client)
+    if is_embedded(client):
+        logger.warning("⚠️ Embedded Qdrant keeps float32 vectors in memory; storage modes apply to a Qdrant server")
+        return False
+    dense = get_collection_layout(client)["dense"]
+    client.update_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config={dense: models.VectorParamsDiff(
+            on_disk=vectors_on_disk(mode),
+            quantization_config=quantization_config(mode) or models.Disabled.DISABLED
+        )},
+        # Collections created before per-vector quantization also quantized the ColBERT vectors
+        quantization_config=models.Disabled.DISABLED
+    )
+    bump_data_version()
+    logger.info(f"✅ Collection {COLLECTION_NAME} storage mode set to {mode} (optimizer rebuilds in background)")
+    return True
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vector store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Rebuild the collection with the current vector layout")
+    migrate_parser.add_argument("--batch-size", type=int, default=256)
+    subparsers.add_parser("storage", help=f"Apply VECTOR_STORAGE_MODE ({VECTOR_STORAGE_MODE}) to the existing collection")
+    subparsers.add_parser("rebuild-catalog", help=f"Rebuild the document catalog ({MANIFEST_COLLECTION_NAME}) from the chunks")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_collection(batch_size=args.batch_size)
+    elif args.command == "storage":
+        apply_storage_mode()
+    elif args.command == "rebuild-catalog":
+        rebuild_catalog()